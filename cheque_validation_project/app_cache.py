@@ -0,0 +1,77 @@
+# app_cache.py
+"""
+Caching shared by the Streamlit pages.
+
+The cheque store is a process-wide resource. Query results are cached per data version:
+cheques are inserted by the job workers (other processes), so each rerun reads a cheap version
+token from the store and any insert makes the cached results miss. The TTL bounds how stale
+results can get after edits or deletes that leave the token unchanged.
+"""
+import os
+
+import streamlit as st
+from pymongo import MongoClient
+
+from storage import STORAGE_BACKEND, DB_NAME, MongoChequeStore, SQLiteChequeStore
+from jobs import JobQueue
+
+# Query cache settings
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "300"))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "200"))
+
+
+# Resources (one per process)
+@st.cache_resource
+def get_mongo_client():
+    return MongoClient(st.secrets["MONGO_URI"])  # Access MongoDB URI from secrets.toml
+
+
+@st.cache_resource
+def get_page_store():
+    """
+    The STORAGE_BACKEND cheque store the pages read from, with its filter indexes created on first use.
+    Unlike storage.get_cheque_store it connects with the MONGO_URI from secrets.toml, and it is read-only,
+    so stores that still need `python storage.py --migrate-keys` stay readable.
+    """
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteChequeStore(read_only=True)
+    return MongoChequeStore(get_mongo_client()[DB_NAME], read_only=True)
+
+
+@st.cache_resource
+def get_job_queue():
+    """One queue per process, so its per-thread SQLite connections are reused across reruns."""
+    return JobQueue()
+
+
+def data_version():
+    """Token that changes whenever cheques are inserted or removed, by any process."""
+    return get_page_store().data_version()
+
+
+# Query results; the version argument only keys the cache
+@st.cache_data(ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_banks(version):
+    return get_page_store().list_banks()
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_count(bank, search, version):
+    return get_page_store().count(bank, search)
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_page(bank, search, page, page_size, version):
+    return get_page_store().query(bank, search, page, page_size)
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_aggregates(version):
+    """Daily and per-bank totals."""
+    return get_page_store().aggregate()
+
+
+def invalidate_cheque_caches():
+    """Drop cached query results, e.g. right after this process saw cheques being saved."""
+    for cached in (cached_banks, cached_count, cached_page, cached_aggregates):
+        cached.clear()
@@ -0,0 +1,238 @@
+# artifacts.py
+"""
+Content-addressed store for processed cheque images.
+
+Images are keyed by the SHA-256 of their pixels, so reprocessing the same cheque reuses the
+stored file instead of writing another one, and concurrent uploads never overwrite each
+other. Files are sharded into two directory levels to keep listings short, and a SQLite
+index tracks sizes and access times so eviction never has to walk the directory tree.
+Images linked from saved cheques ("imageKey") are pinned and never evicted.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+import cv2
+import numpy as np
+
+from metrics import span, increment
+
+# Store settings
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "artifacts")
+# "png" (lossless), "jpeg" or "webp"
+ARTIFACT_FORMAT = os.getenv("ARTIFACT_FORMAT", "jpeg")
+ARTIFACT_QUALITY = int(os.getenv("ARTIFACT_QUALITY", "90"))
+ARTIFACT_PNG_COMPRESSION = int(os.getenv("ARTIFACT_PNG_COMPRESSION", "3"))
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(1024 * 1024 * 1024)))
+ARTIFACT_MAX_AGE_SECONDS = int(os.getenv("ARTIFACT_MAX_AGE_SECONDS", str(30 * 24 * 3600)))
+# Eviction runs from put(), at most once per interval (and on the first put of each process)
+ARTIFACT_EVICT_INTERVAL = float(os.getenv("ARTIFACT_EVICT_INTERVAL", "60"))
+
+EXTENSIONS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    kind TEXT,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    pinned INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_artifacts_accessed ON artifacts (accessed);
+"""
+
+
+def image_key(image):
+    """Content address of an image: SHA-256 of its shape, dtype and pixels."""
+    image = np.ascontiguousarray(image)
+    digest = hashlib.sha256(f"{image.shape}:{image.dtype}".encode("ascii"))
+    digest.update(image.data)
+    return digest.hexdigest()
+
+
+def encode_params(image_format, quality=ARTIFACT_QUALITY, png_compression=ARTIFACT_PNG_COMPRESSION):
+    """cv2.imencode parameters for an artifact format."""
+    if image_format == "png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+    if image_format == "jpeg":
+        return [cv2.IMWRITE_JPEG_QUALITY, quality, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+    if image_format == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, quality]
+    raise ValueError(f"Unsupported artifact format: {image_format}")
+
+
+class ArtifactStore:
+    def __init__(self, root=ARTIFACT_DIR, image_format=ARTIFACT_FORMAT, quality=ARTIFACT_QUALITY,
+                 max_bytes=ARTIFACT_MAX_BYTES, max_age_seconds=ARTIFACT_MAX_AGE_SECONDS,
+                 evict_interval=ARTIFACT_EVICT_INTERVAL):
+        """
+        Content-addressed image store with size- and age-based eviction; safe across threads and processes
+        :param root: Directory holding the image shards and the index
+        :param image_format: Encoding for new artifacts: "png", "jpeg" or "webp"
+        :param quality: JPEG/WebP quality (1-100)
+        :param max_bytes: Size budget for unpinned artifacts; least recently used ones are evicted beyond it
+        :param max_age_seconds: Artifacts not accessed for this long are evicted (0 keeps them)
+        :param evict_interval: Minimum seconds between automatic evictions
+        """
+        self.root = root
+        self.image_format = image_format
+        self.extension = EXTENSIONS[image_format]
+        self.params = encode_params(image_format, quality)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.evict_interval = evict_interval
+        self._local = threading.local()
+        self._evict_lock = threading.Lock()
+        self._last_evicted = 0.0
+        os.makedirs(root, exist_ok=True)
+
+    def _db(self):
+        """Open this thread's index connection and create the table on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.root, "index.db"), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            # Indexes created before pinning existed
+            if "pinned" not in [column[1] for column in conn.execute("PRAGMA table_info(artifacts)")]:
+                conn.execute("ALTER TABLE artifacts ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+            self._local.conn = conn
+        return conn
+
+    def _relative_path(self, key):
+        return os.path.join(key[:2], key[2:4], key + self.extension)
+
+    def put(self, image, kind="cheque"):
+        """
+        Store a BGR/grayscale image and return its key; an image that is already stored is reused
+        :param image: Image ndarray
+        :param kind: Label kept in the index, e.g. "cheque" for the cropped page
+        """
+        key = image_key(image)
+        conn = self._db()
+        now = time.time()
+        with span("artifact_store"):
+            # One transaction with the index, so a concurrent eviction cannot remove the file in between
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT path FROM artifacts WHERE key = ?", (key,)).fetchone()
+                if row is not None and os.path.exists(os.path.join(self.root, row[0])):
+                    conn.execute("UPDATE artifacts SET accessed = ? WHERE key = ?", (now, key))
+                    conn.execute("COMMIT")
+                    increment("artifact_reuses")
+                    return key
+
+                ok, encoded = cv2.imencode(self.extension, image, self.params)
+                if not ok:
+                    raise ValueError(f"Could not encode artifact as {self.image_format}")
+                relative_path = self._relative_path(key)
+                path = os.path.join(self.root, relative_path)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write under a unique name and rename, so readers never see a partial file
+                temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(encoded.tobytes())
+                os.replace(temp_path, path)
+                conn.execute(
+                    "INSERT INTO artifacts (key, path, kind, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET path = excluded.path, size = excluded.size, "
+                    "accessed = excluded.accessed",
+                    (key, relative_path, kind, encoded.size, now, now),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            increment("artifact_writes")
+
+        if now - self._last_evicted >= self.evict_interval:
+            self.evict(now, keep=key)
+        return key
+
+    def pin(self, keys):
+        """Exempt artifacts from eviction, e.g. the images linked from saved cheques."""
+        self._db().executemany("UPDATE artifacts SET pinned = 1 WHERE key = ?", [(key,) for key in keys])
+
+    def path(self, key):
+        """Filesystem path of a stored artifact, or None if it is unknown or was evicted."""
+        row = self._db().execute("SELECT path FROM artifacts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        path = os.path.join(self.root, row[0])
+        return path if os.path.exists(path) else None
+
+    def get(self, key):
+        """Decode a stored artifact, or return None."""
+        path = self.path(key)
+        if path is None:
+            return None
+        self._db().execute("UPDATE artifacts SET accessed = ? WHERE key = ?", (time.time(), key))
+        return cv2.imread(path, cv2.IMREAD_UNCHANGED)
+
+    def evict(self, now=None, keep=None):
+        """
+        Drop unpinned artifacts not accessed within max_age_seconds, then least recently used ones over max_bytes
+        :param now: Current time
+        :param keep: Key that is never evicted, e.g. the one put() is about to return
+        """
+        now = now or time.time()
+        cutoff = now - self.max_age_seconds if self.max_age_seconds else float("-inf")
+        with self._evict_lock:
+            self._last_evicted = now
+            conn = self._db()
+            # Rows and files go together, so a concurrent put() of the same image waits for both
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT key, path, size, accessed FROM artifacts WHERE pinned = 0 ORDER BY accessed DESC"
+                ).fetchall()
+                kept = 0
+                stale = []
+                for key, path, size, accessed in rows:
+                    if key != keep and (accessed < cutoff or kept + size > self.max_bytes):
+                        stale.append((key, path))
+                    else:
+                        kept += size
+
+                conn.executemany("DELETE FROM artifacts WHERE key = ?", [(key,) for key, _ in stale])
+                for _, path in stale:
+                    try:
+                        os.remove(os.path.join(self.root, path))
+                    except FileNotFoundError:
+                        pass
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if not stale:
+                return 0
+
+            increment("artifact_evictions", len(stale))
+            logging.info(f"Evicted {len(stale)} artifact(s) from {self.root}")
+            return len(stale)
+
+    def stats(self):
+        """Number and total size of the stored artifacts, and how many of them are pinned."""
+        count, total, pinned = self._db().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(pinned), 0) FROM artifacts"
+        ).fetchone()
+        return {"artifacts": count, "bytes": total, "pinned": pinned}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store():
+    """Return the process-wide artifact store, creating it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ArtifactStore()
+    return _store
@@ -0,0 +1,58 @@
+# banks.py
+"""
+Bank codes for cheque keys.
+
+Gemini and the regex return the bank as free text, so "SBI", "State Bank of India" and
+"STATE BANK OF INDIA" all name the same bank. Cheques are keyed on a bank code instead: the
+bank's IFSC prefix when the name is a known bank, otherwise the normalized name itself.
+"""
+import re
+
+# IFSC bank prefixes and the names and abbreviations printed or extracted for them
+BANK_ALIASES = {
+    "SBIN": ("State Bank of India", "SBI"),
+    "HDFC": ("HDFC Bank", "Housing Development Finance Corporation Bank"),
+    "ICIC": ("ICICI Bank", "Industrial Credit and Investment Corporation of India Bank"),
+    "UTIB": ("Axis Bank", "UTI Bank"),
+    "KKBK": ("Kotak Mahindra Bank", "Kotak Bank"),
+    "PUNB": ("Punjab National Bank", "PNB"),
+    "BARB": ("Bank of Baroda", "BOB"),
+    "CNRB": ("Canara Bank",),
+    "UBIN": ("Union Bank of India", "UBI"),
+    "BKID": ("Bank of India", "BOI"),
+    "CBIN": ("Central Bank of India", "CBI"),
+    "IDIB": ("Indian Bank",),
+    "IOBA": ("Indian Overseas Bank", "IOB"),
+    "UCBA": ("UCO Bank", "United Commercial Bank"),
+    "MAHB": ("Bank of Maharashtra", "BOM"),
+    "PSIB": ("Punjab & Sind Bank", "PSB"),
+    "YESB": ("Yes Bank",),
+    "INDB": ("IndusInd Bank",),
+    "IDFB": ("IDFC First Bank", "IDFC Bank"),
+    "FDRL": ("Federal Bank",),
+}
+
+# Words that do not tell banks apart
+IGNORED_WORDS = {"THE", "BANK", "LTD", "LIMITED"}
+
+
+def normalize_bank_name(name):
+    """Upper-case a bank name without punctuation and filler words: "The S.B.I. Bank Ltd." -> "SBI"."""
+    name = (name or "").upper().replace("&", " AND ")
+    # Dots, apostrophes and hyphens join their neighbours ("S.B.I.", "CO-OPERATIVE"); other symbols separate words
+    name = re.sub(r"[.'-]", "", name)
+    words = re.sub(r"[^A-Z0-9]+", " ", name).split()
+    return " ".join(word for word in words if word not in IGNORED_WORDS)
+
+
+_CODES = {normalize_bank_name(alias): code for code, aliases in BANK_ALIASES.items() for alias in aliases}
+
+
+def bank_code(name):
+    """
+    Identifier of the bank a cheque is drawn on
+    :param name: Bank name as extracted
+    :return: IFSC bank prefix for known banks, else the normalized name ("" when there is none)
+    """
+    normalized = normalize_bank_name(name)
+    return _CODES.get(normalized, normalized)
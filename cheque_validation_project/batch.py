@@ -0,0 +1,239 @@
+# batch.py
+"""
+Headless bulk processing: run the full cheque pipeline over image files, PDFs and directories.
+
+Results stream out as JSON Lines, one record per page. Each finished input file is appended to a
+checkpoint, so rerunning the same command after a crash or Ctrl-C skips the files already done;
+files that raised or have failed pages are not checkpointed and are retried:
+    python batch.py scans/ statements.pdf --output results.jsonl --checkpoint results.checkpoint --workers 4
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import multiprocessing
+from collections import Counter
+
+# Input files picked up from directories
+CONTENT_TYPES = {
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+}
+
+# Status of a file whose processing raised; it is not checkpointed, so the next run retries it
+FILE_ERROR = "error"
+
+
+def find_input_files(inputs):
+    """Expand files and directories (recursively, in sorted order) into the supported input files."""
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                             if os.path.splitext(name)[1].lower() in CONTENT_TYPES)
+        elif os.path.splitext(path)[1].lower() in CONTENT_TYPES:
+            files.append(path)
+        else:
+            logging.warning(f"Skipping unsupported input {path}")
+    return [os.path.abspath(path) for path in files]
+
+
+def load_checkpoint(path):
+    """Set of input files already completed by earlier runs."""
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def _sync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def configure(requests_per_minute=None, gemini_concurrency=None, ocr_threads=None):
+    """
+    Apply the rate and concurrency knobs, then load the OCR engine on this process's main thread;
+    must run before the pipeline imports its engines.
+    """
+    if requests_per_minute is not None:
+        os.environ["GEMINI_REQUESTS_PER_MINUTE"] = str(requests_per_minute)
+    if gemini_concurrency is not None:
+        os.environ["GEMINI_MAX_CONCURRENCY"] = str(gemini_concurrency)
+    if ocr_threads is not None:
+        os.environ["OCR_POOL_SIZE"] = str(ocr_threads)
+
+    from ocr_engine import load_ocr_engine
+    load_ocr_engine()
+
+
+def process_file(path, save=True, store_images=True):
+    """
+    Run one input file through the pipeline
+    :param path: Image or PDF file
+    :param save: Check for duplicates and insert new cheques in the database; False only extracts
+    :param store_images: Keep the cropped pages in the artifact store (linked as "imageKey")
+    :return: (path, page records in page order, number of failed pages, error message or None)
+    """
+    import pipeline
+    from storage import get_cheque_store
+    from artifacts import get_artifact_store
+
+    try:
+        store = None
+        if save:
+            store, connection_status = get_cheque_store()
+            if store is None:
+                # Every page would fail to save; report the file so the next run retries it
+                raise RuntimeError(connection_status)
+
+        content_type = CONTENT_TYPES[os.path.splitext(path)[1].lower()]
+        # Later results for a page (after the bulk insert) replace its "extracted" result
+        pages = {}
+        artifacts = get_artifact_store() if store_images else None
+        for result in pipeline.process_document(path, content_type, os.path.basename(path), store, save=save,
+                                                artifacts=artifacts):
+            pages[result.page] = {
+                "file": path,
+                "page": result.page,
+                "status": result.status,
+                "note": result.note,
+                "data": result.data,
+            }
+        failed = sum(record["status"] == pipeline.PAGE_FAILED for record in pages.values())
+        return path, [pages[page] for page in sorted(pages)], failed, None
+    except Exception as e:
+        logging.error(f"Failed to process {path}: {e}")
+        return path, [], 0, str(e)
+
+
+def _process_task(task):
+    result = process_file(*task)
+    if multiprocessing.parent_process() is not None:
+        # Pool workers keep their own metrics, so each one writes its file after every input file
+        from metrics import write_metrics_file
+        write_metrics_file(worker=multiprocessing.current_process().name)
+    return result
+
+
+def run_batch(inputs, output=None, checkpoint=None, workers=1, save=True, store_images=True,
+              requests_per_minute=None, gemini_concurrency=None, ocr_threads=None):
+    """
+    Process every input file not yet in the checkpoint, streaming page records as JSON Lines
+    :param inputs: Files and directories to process
+    :param output: JSON Lines file to append to (None writes to stdout)
+    :param checkpoint: File listing completed inputs; None disables resuming
+    :param workers: Number of worker processes, each handling one file at a time
+    :param save: Check for duplicates and insert new cheques in the database
+    :param store_images: Keep the cropped pages in the artifact store
+    :param requests_per_minute: Gemini request budget shared by all workers
+    :param gemini_concurrency: Concurrent Gemini requests per worker
+    :param ocr_threads: OCR engines per worker
+    :return: Counter of files and page statuses
+    Pipeline metrics go to METRICS_FILE at the end of an inline run; worker processes write one file each.
+    """
+    files = find_input_files(inputs)
+    done = load_checkpoint(checkpoint)
+    pending = [path for path in files if path not in done]
+    stats = Counter(files_skipped=len(files) - len(pending))
+    logging.info(f"Batch: {len(pending)} file(s) to process, {stats['files_skipped']} already done")
+    if not pending:
+        return stats
+
+    workers = max(1, min(workers, len(pending)))
+    if requests_per_minute is not None:
+        requests_per_minute /= workers
+    knobs = (requests_per_minute, gemini_concurrency, ocr_threads)
+    tasks = [(path, save, store_images) for path in pending]
+
+    out = open(output, "a", encoding="utf-8") if output else sys.stdout
+    done_file = open(checkpoint, "a", encoding="utf-8") if checkpoint else None
+    pool = None
+    start = time.perf_counter()
+    try:
+        if workers == 1:
+            configure(*knobs)
+            results = map(_process_task, tasks)
+        else:
+            # Spawned like the job workers, so each process sets its knobs before importing the pipeline
+            pool = multiprocessing.get_context("spawn").Pool(workers, initializer=configure, initargs=knobs)
+            results = pool.imap_unordered(_process_task, tasks)
+
+        for path, records, failed_pages, error in results:
+            if error is not None:
+                stats["files_failed"] += 1
+                out.write(json.dumps({"file": path, "status": FILE_ERROR, "note": error}) + "\n")
+                out.flush()
+                continue
+            for record in records:
+                out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                stats[record["status"]] += 1
+            # Checkpoint only after the file's records are on disk: a crash in between reprocesses
+            # the file (and dedup keeps it from being stored twice) rather than losing its results
+            if out is sys.stdout:
+                out.flush()
+            else:
+                _sync(out)
+            # Pages that failed to extract or save leave the file for the next run to retry
+            if failed_pages:
+                stats["files_incomplete"] += 1
+                logging.warning(f"Not checkpointing {path}: {failed_pages} page(s) failed")
+                continue
+            if done_file is not None:
+                done_file.write(path + "\n")
+                _sync(done_file)
+            stats["files_done"] += 1
+            logging.info(f"Finished {path} ({len(records)} page(s), "
+                         f"{stats['files_done']}/{len(pending)} file(s))")
+        if pool is not None:
+            pool.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if out is not sys.stdout:
+            out.close()
+        if done_file is not None:
+            done_file.close()
+        if pool is None:
+            from metrics import write_metrics_file
+            write_metrics_file()
+        logging.info(f"Batch stopped after {time.perf_counter() - start:.1f}s: {dict(stats)}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the cheque pipeline over files and directories.")
+    parser.add_argument("inputs", nargs="+", help="image/PDF files or directories of them")
+    parser.add_argument("--output", help="JSON Lines file to append results to (default: stdout)")
+    parser.add_argument("--checkpoint", help="file recording completed inputs; rerun with it to resume")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--requests-per-minute", type=float,
+                        help="Gemini request budget shared by all workers (default: GEMINI_REQUESTS_PER_MINUTE)")
+    parser.add_argument("--gemini-concurrency", type=int, help="concurrent Gemini requests per worker")
+    parser.add_argument("--ocr-threads", type=int, help="OCR engines per worker")
+    parser.add_argument("--no-db", action="store_true", help="extract only; skip database duplicate checks and inserts")
+    parser.add_argument("--no-images", action="store_true", help="do not keep the cropped pages in the artifact store")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    requests_per_minute = args.requests_per_minute
+    if requests_per_minute is None:
+        requests_per_minute = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60"))
+    try:
+        stats = run_batch(args.inputs, args.output, args.checkpoint, args.workers, not args.no_db,
+                          not args.no_images, requests_per_minute, args.gemini_concurrency, args.ocr_threads)
+    except KeyboardInterrupt:
+        logging.warning("Interrupted; rerun with the same --checkpoint to resume")
+        sys.exit(130)
+    sys.exit(1 if stats["files_failed"] or stats["files_incomplete"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# benchmarks/border_scale.py
+"""
+Corner accuracy and speed of downscaled border detection vs. full resolution.
+
+Run from the project directory:
+    python -m benchmarks.border_scale --resolution 3 --max-dims 600 800 1000 1200
+"""
+import json
+import argparse
+
+from benchmarks.synthetic import generate_scans
+from border_processing import evaluate_detection_scale
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Choose a border detection scale on synthetic scans.")
+    parser.add_argument("--count", type=int, default=20, help="number of synthetic scans")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skew", type=float, default=0.03, help="max corner jitter as a fraction of cheque size")
+    parser.add_argument("--noise", type=float, default=8.0, help="Gaussian noise sigma")
+    parser.add_argument("--resolution", type=float, default=3.0, help="scale factor for cheque and scan size")
+    parser.add_argument("--max-dims", type=int, nargs="+", default=[600, 800, 1000, 1200],
+                        help="detection sizes (longest side) to evaluate")
+    parser.add_argument("--no-refine", action="store_true", help="skip full-resolution corner refinement")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    scans = [scan for _, scan in generate_scans(args.count, seed=args.seed, skew=args.skew, noise=args.noise,
+                                                resolution=args.resolution)]
+    results = [evaluate_detection_scale(scans, max_dim, refine_corners=not args.no_refine)
+               for max_dim in args.max_dims]
+
+    print(f"{'max dim':>8}{'compared':>10}{'missed':>8}{'mean px':>9}{'p95 px':>9}{'max px':>9}{'speedup':>9}")
+    for result in results:
+        print(f"{result['detection_max_dim']:>8}{result['compared']:>10}{result['missed']:>8}"
+              f"{result['mean_corner_error']:>9.2f}{result['p95_corner_error']:>9.2f}"
+              f"{result['max_corner_error']:>9.2f}{result['speedup']:>8.1f}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
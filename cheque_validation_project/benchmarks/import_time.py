@@ -0,0 +1,86 @@
+# benchmarks/import_time.py
+"""
+Cold-start report: how long each entry module takes to import, and which packages the time goes to.
+
+Every measurement runs in a fresh interpreter with -X importtime. Run from the project directory:
+    python -m benchmarks.import_time --modules utils pipeline app_cache --output import_times.json
+"""
+import re
+import sys
+import json
+import argparse
+import subprocess
+from collections import Counter
+
+# Modules loaded when a worker starts or a page first renders
+ENTRY_MODULES = ["utils", "pipeline", "jobs", "app_cache", "exports", "batch", "streamlit"]
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$")
+
+
+def measure_import(module):
+    """
+    Import a module in a fresh interpreter
+    :return: (wall seconds, [(self_us, cumulative_us, depth, name), ...] for the module's import tree)
+    """
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            depth = (len(match.group(3)) - 1) // 2
+            rows.append((int(match.group(1)), int(match.group(2)), depth, match.group(4)))
+
+    # The output is post-order: the module's tree is the run of nested rows just before its own row
+    end = max(i for i, row in enumerate(rows) if row[2] == 0 and row[3] == module)
+    start = end
+    while start > 0 and rows[start - 1][2] > 0:
+        start -= 1
+    return float(result.stdout.strip().splitlines()[-1]), rows[start:end + 1]
+
+
+def summarize(module, repeat=3, top=10):
+    """Import timings for one module, keeping the fastest of `repeat` cold imports."""
+    wall, tree = min((measure_import(module) for _ in range(repeat)), key=lambda measured: measured[0])
+    packages = Counter()
+    for self_us, _, _, name in tree:
+        packages[name.split(".")[0]] += self_us
+    direct = sorted((row for row in tree if row[2] == 1), key=lambda row: row[1], reverse=True)
+    return {
+        "module": module,
+        "wall_ms": wall * 1000,
+        "modules_imported": len(tree),
+        "direct_imports_ms": {name: cumulative / 1000 for _, cumulative, _, name in direct[:top]},
+        "packages_ms": {name: self_us / 1000 for name, self_us in packages.most_common(top)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report per-module import cost for cold starts.")
+    parser.add_argument("--modules", nargs="+", default=ENTRY_MODULES, help="entry modules to import")
+    parser.add_argument("--repeat", type=int, default=3, help="cold imports per module (fastest is kept)")
+    parser.add_argument("--top", type=int, default=8, help="imports and packages listed per module")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    results = [summarize(module, args.repeat, args.top) for module in args.modules]
+
+    for result in results:
+        print(f"{result['module']}: {result['wall_ms']:.0f} ms, {result['modules_imported']} modules")
+        print(f"  {'direct import':<32}{'ms':>8}     {'package (self time)':<24}{'ms':>8}")
+        direct = list(result["direct_imports_ms"].items())
+        packages = list(result["packages_ms"].items())
+        for i in range(max(len(direct), len(packages))):
+            left = f"  {direct[i][0]:<32}{direct[i][1]:>8.1f}" if i < len(direct) else " " * 42
+            right = f"     {packages[i][0]:<24}{packages[i][1]:>8.1f}" if i < len(packages) else ""
+            print(left + right)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+# benchmarks/run_benchmarks.py
+"""
+End-to-end pipeline benchmark on synthetic cheques.
+
+Run from the project directory:
+    python -m benchmarks.run_benchmarks --count 200 --save-baseline baseline.json
+    python -m benchmarks.run_benchmarks --count 200 --baseline baseline.json
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import tempfile
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from benchmarks.synthetic import generate_scans, write_pdf, amount_to_words, format_indian
+
+
+# Local stand-ins
+class _StubGeminiHandler(BaseHTTPRequestHandler):
+    """Answers generateContent requests with a fixed cheque after a configurable delay."""
+    latency = 0.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        text = json.dumps({"chequeNumber": "000000", "accountNumber": "", "amount in numbers": "", "amount in words": "",
+                           "date": "", "payee": "", "bank": ""})
+        body = json.dumps({"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_gemini(latency):
+    """Start the stub Gemini server on a free local port and return its base URL."""
+    _StubGeminiHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubGeminiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+class _InsertResult:
+    def __init__(self, inserted_id=None, inserted_ids=None):
+        self.inserted_id = inserted_id
+        self.inserted_ids = inserted_ids
+
+
+class InMemoryCollection:
+    """Minimal in-process stand-in for the pymongo collection calls made by utils."""
+
+    def __init__(self, name):
+        self.full_name = name
+        self.documents = []
+        self._next_id = 1
+
+    def with_options(self, **kwargs):
+        return self
+
+    def create_index(self, keys, **kwargs):
+        return kwargs.get("name")
+
+    def index_information(self):
+        return {}
+
+    def find_one(self, filter=None, projection=None):
+        # Only asked, by ensure_indexes, before any cheque is inserted
+        return None
+
+    def insert_one(self, document):
+        document.setdefault("_id", self._next_id)
+        self._next_id += 1
+        self.documents.append(document)
+        return _InsertResult(inserted_id=document["_id"])
+
+    def insert_many(self, documents, ordered=True):
+        return _InsertResult(inserted_ids=[self.insert_one(document).inserted_id for document in documents])
+
+    def bulk_write(self, requests, ordered=True):
+        self.documents.extend(requests)
+
+
+class InMemoryDatabase(dict):
+    """Creates collections on first access, like a pymongo Database."""
+
+    def __missing__(self, name):
+        self[name] = InMemoryCollection(name)
+        return self[name]
+
+
+# Measurement helpers
+class StageTimer:
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def record(self, name, seconds):
+        self.samples[name].append(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        yield
+        self.record(name, time.perf_counter() - start)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(samples):
+    """Per-stage count, throughput and latency percentiles (ms)."""
+    summary = {}
+    for name, values in samples.items():
+        values = np.asarray(values)
+        p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+        summary[name] = {
+            "count": int(values.size),
+            "throughput_per_sec": float(values.size / values.sum()) if values.sum() else 0.0,
+            "mean_ms": float(values.mean() * 1000),
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+        }
+    return summary
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Return a list of regression messages where p95 latency or throughput got worse than tolerance allows."""
+    regressions = []
+    for name, current in results["stages"].items():
+        previous = baseline.get("stages", {}).get(name)
+        if not previous:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.2f}ms -> {current['p95_ms']:.2f}ms")
+        if current["throughput_per_sec"] < previous["throughput_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['throughput_per_sec']:.2f}/s -> "
+                               f"{current['throughput_per_sec']:.2f}/s")
+    if results["peak_rss_mb"] > baseline.get("peak_rss_mb", float("inf")) * (1 + tolerance):
+        regressions.append(f"peak RSS {baseline['peak_rss_mb']:.1f}MB -> {results['peak_rss_mb']:.1f}MB")
+    return regressions
+
+
+def fields_to_text(fields):
+    """Ground-truth zone text, used for the extraction stages when OCR is skipped."""
+    return "\n".join([
+        f"Bank: {fields['bank']}",
+        f"Date: {fields['date']}",
+        f"Pay: {fields['payee']}",
+        f"Rupees: {amount_to_words(fields['amount'])}",
+        f"Amount Rs.: {format_indian(fields['amount'])}",
+        f"A/c No: {fields['accountNumber']}",
+        f"MICR: {fields['chequeNumber']} {fields['micrCode']} {fields['accountNumber'][-6:]} 10",
+    ])
+
+
+def run(args):
+    # The stub endpoint must be configured before gemini_engine is imported
+    os.environ["GEMINI_API_ENDPOINT"] = start_stub_gemini(args.gemini_latency)
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+    import utils
+    from extraction import extract_with_confidence
+    from gemini_engine import GeminiRefiner
+    from zone_ocr import ocr_zones, format_zone_text
+    from quality import assess_page
+    from micr import read_micr, MICR_TRUSTED, MICR_MIN_CONFIDENCE
+    logging.getLogger().setLevel(logging.WARNING)
+
+    from storage import MongoChequeStore, SQLiteChequeStore
+    if args.sqlite:
+        store = SQLiteChequeStore(args.sqlite)
+    elif args.mongo_uri:
+        from pymongo import MongoClient
+        store = MongoChequeStore(MongoClient(args.mongo_uri)[args.mongo_db])
+    else:
+        store = MongoChequeStore(InMemoryDatabase())
+
+    timer = StageTimer()
+    refiner = GeminiRefiner(max_concurrency=1, requests_per_minute=1e9, cache=None)
+    # Flushed explicitly below so each bulk write can be timed
+    writer = utils.BulkChequeWriter(store, batch_size=float("inf"), flush_interval=float("inf"))
+    counters = defaultdict(int)
+    run_ocr = not args.skip_ocr
+
+    start = time.perf_counter()
+    scans = generate_scans(args.count, seed=args.seed, skew=args.skew, noise=args.noise, resolution=args.resolution,
+                           micr_band=args.micr_band)
+    for i, (fields, scan) in enumerate(scans, start=1):
+        with timer.stage("border_detection"):
+            try:
+                warped, border_found = utils.get_border_processor().process_array(scan), True
+            except ValueError:
+                warped, border_found = scan, False
+                counters["border_fallbacks"] += 1
+
+        # Every page is timed through the remaining stages; the gate's decisions are only counted
+        with timer.stage("quality_gate"):
+            report = assess_page(warped, border_found)
+        counters[f"quality_{report.action}"] += 1
+
+        with timer.stage("micr_decode"):
+            micr = read_micr(warped) if border_found else None
+        # Confident misreads are the ones that could reach a cheque record
+        if micr is not None and micr.field_confidence["chequeNumber"] >= MICR_MIN_CONFIDENCE:
+            matched = micr.data["chequeNumber"] == fields["chequeNumber"]
+            counters["micr_cheque_number_matches" if matched else "micr_cheque_number_misreads"] += 1
+
+        with timer.stage("preprocessing"):
+            processed = utils.preprocess_image(warped)
+
+        text = fields_to_text(fields)
+        if run_ocr:
+            try:
+                with timer.stage("ocr"):
+                    zone_text = ocr_zones(processed)
+                if micr is not None and MICR_TRUSTED and micr.confidence >= MICR_MIN_CONFIDENCE:
+                    zone_text["micr"] = micr.line
+                text = format_zone_text(zone_text)
+            except Exception as e:
+                logging.warning(f"OCR unavailable, using ground-truth text: {e}")
+                run_ocr = False
+
+        with timer.stage("local_extraction"):
+            extraction = extract_with_confidence(text)
+        if extraction.data["chequeNumber"] == fields["chequeNumber"]:
+            counters["cheque_number_matches"] += 1
+
+        with timer.stage("gemini_refinement"):
+            cheque_data = refiner.refine(text, use_cache=False) or {}
+
+        cheque_data["timestamp"] = "2025-01-01T00:00:00"
+        with timer.stage("db_insert_one"):
+            utils.insert_cheque_details(store, dict(cheque_data))
+
+        writer.add(dict(cheque_data))
+        if i % args.batch_size == 0:
+            with timer.stage("db_bulk_flush"):
+                writer.flush()
+    with timer.stage("db_bulk_flush"):
+        writer.flush()
+    wall = time.perf_counter() - start
+
+    if args.pdf_pages:
+        with tempfile.TemporaryDirectory() as tmp:
+            pdf_path = os.path.join(tmp, "batch.pdf")
+            write_pdf(pdf_path, args.pdf_pages, seed=args.seed, skew=args.skew, noise=args.noise,
+                      resolution=args.resolution)
+            try:
+                pages = utils.process_pdf(pdf_path, save=False)
+                while True:
+                    page_start = time.perf_counter()
+                    if next(pages, None) is None:
+                        break
+                    timer.record("pdf_page", time.perf_counter() - page_start)
+            except Exception as e:
+                logging.warning(f"PDF stage skipped: {e}")
+                timer.samples.pop("pdf_page", None)
+
+    return {
+        "count": args.count,
+        "settings": {"skew": args.skew, "noise": args.noise, "resolution": args.resolution, "ocr": run_ocr,
+                     "gemini_latency": args.gemini_latency, "db": "sqlite" if args.sqlite else "mongodb" if args.mongo_uri else "in-memory"},
+        "wall_seconds": wall,
+        "end_to_end_per_sec": args.count / wall if wall else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "counters": dict(counters),
+        "stages": summarize(timer.samples),
+    }
+
+
+def print_report(results):
+    print(f"{'stage':<20}{'count':>7}{'per sec':>11}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stage in results["stages"].items():
+        print(f"{name:<20}{stage['count']:>7}{stage['throughput_per_sec']:>11.1f}"
+              f"{stage['p50_ms']:>10.2f}{stage['p95_ms']:>10.2f}{stage['p99_ms']:>10.2f}")
+    print(f"end-to-end: {results['end_to_end_per_sec']:.2f} cheques/sec, peak RSS {results['peak_rss_mb']:.1f}MB, "
+          f"counters {results['counters']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cheque pipeline on synthetic cheques.")
+    parser.add_argument("--count", type=int, default=50, help="number of synthetic cheques")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skew", type=float, default=0.03, help="max corner jitter as a fraction of cheque size")
+    parser.add_argument("--noise", type=float, default=8.0, help="Gaussian noise sigma")
+    parser.add_argument("--resolution", type=float, default=1.0, help="scale factor for cheque and scan size")
+    parser.add_argument("--micr-band", choices=["text", "builtin"], default="text",
+                        help="draw the MICR line in the regular font, or with the decoder's built-in glyphs "
+                             "(a self-check)")
+    parser.add_argument("--pdf-pages", type=int, default=0, help="also time process_pdf on a PDF of this many pages")
+    parser.add_argument("--skip-ocr", action="store_true", help="feed ground-truth text to the extraction stages")
+    parser.add_argument("--gemini-latency", type=float, default=0.0, help="stub Gemini response delay in seconds")
+    parser.add_argument("--mongo-uri", help="insert into this MongoDB instead of the in-memory stand-in")
+    parser.add_argument("--mongo-db", default="cheque_benchmark_db")
+    parser.add_argument("--sqlite", help="insert into a SQLite cheque store at this path instead")
+    parser.add_argument("--batch-size", type=int, default=50, help="bulk insert batch size")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--save-baseline", help="write the results as the new baseline")
+    parser.add_argument("--baseline", help="compare against a stored baseline and exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown vs. the baseline")
+    args = parser.parse_args()
+
+    results = run(args)
+    print_report(results)
+
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
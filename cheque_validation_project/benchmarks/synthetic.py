@@ -0,0 +1,138 @@
+# benchmarks/synthetic.py
+import random
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from micr import render_micr_line
+
+BANKS = ["STATE BANK OF INDIA", "HDFC BANK", "ICICI BANK", "PUNJAB NATIONAL BANK", "CANARA BANK"]
+PAYEES = ["JOHN DOE", "ASHA MEHTA", "RAVI KUMAR", "ACME TRADERS", "NEHA SHARMA", "GLOBAL SUPPLIES"]
+
+ONES = ["", "One", "Two", "Three", "Four", "Five", "Six", "Seven", "Eight", "Nine", "Ten", "Eleven", "Twelve",
+        "Thirteen", "Fourteen", "Fifteen", "Sixteen", "Seventeen", "Eighteen", "Nineteen"]
+TENS = ["", "", "Twenty", "Thirty", "Forty", "Fifty", "Sixty", "Seventy", "Eighty", "Ninety"]
+
+
+def _below_hundred(n):
+    return ONES[n] if n < 20 else f"{TENS[n // 10]} {ONES[n % 10]}".strip()
+
+
+def _below_thousand(n):
+    words = f"{ONES[n // 100]} Hundred " if n >= 100 else ""
+    return (words + _below_hundred(n % 100)).strip()
+
+
+def amount_to_words(amount):
+    """Spell a whole-rupee amount using the Indian numbering system."""
+    parts = []
+    for scale, name in ((10_000_000, "Crore"), (100_000, "Lakh"), (1_000, "Thousand")):
+        if amount >= scale:
+            parts.append(f"{_below_thousand(amount // scale)} {name}")
+            amount %= scale
+    if amount:
+        parts.append(_below_thousand(amount))
+    return " ".join(parts) + " Only"
+
+
+def format_indian(amount):
+    """Format a whole-rupee amount with Indian digit grouping, e.g. 1,23,500.00."""
+    digits = str(amount)
+    head, tail = digits[:-3], digits[-3:]
+    groups = []
+    while len(head) > 2:
+        groups.insert(0, head[-2:])
+        head = head[:-2]
+    if head:
+        groups.insert(0, head)
+    return ",".join(groups + [tail]) + ".00" if groups else tail + ".00"
+
+
+def random_cheque_fields(rng):
+    """Pick a random, internally consistent set of cheque field values."""
+    amount = rng.randint(100, 5_000_000)
+    return {
+        "bank": rng.choice(BANKS),
+        "date": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2015, 2025)}",
+        "payee": rng.choice(PAYEES),
+        "amount": amount,
+        "chequeNumber": f"{rng.randint(0, 999999):06d}",
+        "micrCode": f"{rng.randint(0, 999999999):09d}",
+        "accountNumber": "".join(str(rng.randint(0, 9)) for _ in range(14)),
+    }
+
+
+def render_cheque(fields, size=(800, 400), micr_band="text"):
+    """
+    Draw a flat cheque with the fields in the zones used by zone_ocr
+    micr_band "text" prints the MICR line in the regular font, independent of the MICR decoder;
+    "builtin" draws it with the decoder's own glyphs, which only checks the decoder against itself.
+    """
+    width, height = size
+    scale = width / 800
+    image = Image.new("RGB", size, (250, 248, 240))
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=int(22 * scale))
+    small = ImageFont.load_default(size=int(14 * scale))
+
+    def at(x, y):
+        return int(x * scale), int(y * scale)
+
+    draw.text(at(10, 15), fields["bank"], fill="black", font=font)
+    draw.text(at(580, 25), fields["date"], fill="black", font=font)
+    draw.text(at(40, 85), f"Pay {fields['payee']}", fill="black", font=font)
+    draw.text(at(40, 140), f"Rupees {amount_to_words(fields['amount'])}", fill="black", font=small)
+    draw.text(at(600, 140), format_indian(fields["amount"]), fill="black", font=font)
+    draw.text(at(40, 205), f"A/c No. {fields['accountNumber']}", fill="black", font=font)
+    if micr_band == "builtin":
+        # On-us, cheque number, on-us, MICR code, transit, short account number, on-us, transaction code
+        band = render_micr_line(f"C{fields['chequeNumber']}C {fields['micrCode']}A {fields['accountNumber'][-6:]}C 10",
+                                int(18 * scale))
+        image.paste((0, 0, 0), at(120, 358), mask=Image.fromarray(255 - band))
+    else:
+        draw.text(at(120, 360), f"{fields['chequeNumber']} {fields['micrCode']} {fields['accountNumber'][-6:]} 10",
+                  fill="black", font=font)
+    return image
+
+
+def place_on_scan(cheque, rng, skew=0.03, noise=8.0, scan_size=(1400, 900)):
+    """Warp a flat cheque onto a dark scanner background with perspective skew and Gaussian noise."""
+    cheque = cv2.cvtColor(np.asarray(cheque), cv2.COLOR_RGB2BGR)
+    h, w = cheque.shape[:2]
+    scan_w, scan_h = scan_size
+    margin_x, margin_y = (scan_w - w) / 2, (scan_h - h) / 2
+
+    def jitter(x, y):
+        return [x + rng.uniform(-skew, skew) * w, y + rng.uniform(-skew, skew) * h]
+
+    src = np.float32([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]])
+    dst = np.float32([
+        jitter(margin_x, margin_y), jitter(margin_x + w, margin_y),
+        jitter(margin_x + w, margin_y + h), jitter(margin_x, margin_y + h),
+    ])
+    matrix = cv2.getPerspectiveTransform(src, dst)
+    scan = cv2.warpPerspective(cheque, matrix, scan_size, borderValue=(40, 40, 40))
+    if noise:
+        scan = np.clip(scan + np.random.default_rng(rng.randint(0, 2**31)).normal(0, noise, scan.shape), 0, 255)
+    return scan.astype(np.uint8)
+
+
+def generate_scans(count, seed=0, skew=0.03, noise=8.0, resolution=1.0, micr_band="text"):
+    """Yield (fields, BGR scan) pairs; resolution scales the cheque and scan size (micr_band: see render_cheque)."""
+    rng = random.Random(seed)
+    cheque_size = (int(800 * resolution), int(400 * resolution))
+    scan_size = (int(1400 * resolution), int(900 * resolution))
+    for _ in range(count):
+        fields = random_cheque_fields(rng)
+        yield fields, place_on_scan(render_cheque(fields, cheque_size, micr_band), rng, skew, noise, scan_size)
+
+
+def write_pdf(path, count, **kwargs):
+    """Write a multi-page PDF of synthetic scans and return the list of field dicts."""
+    fields, pages = [], []
+    for cheque_fields, scan in generate_scans(count, **kwargs):
+        fields.append(cheque_fields)
+        pages.append(Image.fromarray(cv2.cvtColor(scan, cv2.COLOR_BGR2RGB)))
+    pages[0].save(path, save_all=True, append_images=pages[1:])
+    return fields
@@ -1,44 +1,127 @@
 import cv2
+import heapq
 import numpy as np
 import os
+import time
+import logging
+from collections import deque
+from multiprocessing import Pool
+
+from metrics import span, increment
+from preprocessing import to_bgr
 
 class ChequeBorderProcessor:
-    def __init__(self, output_size=(600, 300), save_intermediate=False):
+    def __init__(self, output_size=(600, 300), save_intermediate=False, detection_max_dim=None,
+                 refine_corners=True):
         """
         Initialize cheque border processor
         :param output_size: Tuple (width, height) for resizing
         :param save_intermediate: Boolean to save processing steps
+        :param detection_max_dim: Find the border on a copy downscaled to this longest side (None uses full resolution)
+        :param refine_corners: Refine corners found on the downscaled copy against the full-resolution image
         """
         self.output_size = output_size
         self.save_intermediate = save_intermediate
+        self.detection_max_dim = detection_max_dim
+        self.refine_corners = refine_corners
     
     def process_image(self, image_path, output_path):
         """Main processing pipeline for a single image"""
         try:
-            # Load and validate image
-            image = cv2.imread(image_path)
-            if image is None:
-                raise ValueError(f"Could not read image: {image_path}")
+            self._process_file(image_path, output_path)
+            return True
             
-            # Preprocessing
-            processed = self._preprocess(image)
+        except Exception as e:
+            logging.warning(f"Error processing {image_path}: {str(e)}")
+            return False
+
+    def process_array(self, image, output_path=None):
+        """
+        Detect, warp and resize a cheque held in memory
+        :param image: BGR/grayscale ndarray or PIL image (RGB or L)
+        :param output_path: Optional path to also write the result to
+        :return: Warped and resized BGR ndarray; raises ValueError if no border is found
+        """
+        with span("border_detection"):
+            image = self._to_bgr(image)
             
             # Border detection
-            contour = self._find_border_contour(processed)
+            try:
+                contour = self._detect_border(image)
+            except ValueError:
+                increment("border_detection_failures")
+                raise
             
             # Perspective correction
             warped = self._perspective_transform(image, contour)
             
             # Resizing
             resized = self._resize_image(warped)
+        
+        # Optional save
+        if output_path is not None and not cv2.imwrite(output_path, resized):
+            raise ValueError(f"Could not write image: {output_path}")
             
-            # Save result
-            cv2.imwrite(output_path, resized)
-            return True
+        return resized
+
+    def _process_file(self, image_path, output_path):
+        """Process a single image file, raising on failure"""
+        # Load and validate image
+        image = cv2.imread(image_path)
+        if image is None:
+            raise ValueError(f"Could not read image: {image_path}")
+        
+        self.process_array(image, output_path)
+
+    def _to_bgr(self, image):
+        """Convert a PIL image or ndarray to a 3-channel BGR ndarray"""
+        return to_bgr(image)
+
+    def _detection_scale(self, image):
+        """Downscale factor for border detection (1.0 when the image is already small enough)"""
+        if not self.detection_max_dim:
+            return 1.0
+        # Whole-number factors keep INTER_AREA on its fast block-averaging path
+        return 1.0 / int(np.ceil(max(image.shape[:2]) / self.detection_max_dim))
+
+    def _detect_border(self, image):
+        """Find the border corners in full-resolution coordinates"""
+        scale = self._detection_scale(image)
+        if scale == 1.0:
+            return self._find_border_contour(self._preprocess(image))
+        
+        small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        contour = self._find_border_contour(self._preprocess(small))
+        
+        # Map pixel centres of the downscaled copy back to the full-resolution image
+        corners = (contour.astype("float32") + 0.5) / scale - 0.5
+        if self.refine_corners:
+            corners = self._refine_corners(image, corners, scale)
+        return corners
+
+    def _refine_corners(self, image, corners, scale):
+        """Refine each corner to sub-pixel accuracy at full resolution"""
+        # The search window spans a few downscaled pixels, enough to cover the coarse corner's error
+        half = max(3, int(np.ceil(3 / scale)))
+        height, width = image.shape[:2]
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.05)
+        refined = corners.copy()
+        
+        for i, (x, y) in enumerate(corners):
+            # Only the patch around the corner is converted, never the whole page
+            x0, y0 = max(int(x) - 2 * half, 0), max(int(y) - 2 * half, 0)
+            x1, y1 = min(int(x) + 2 * half + 1, width), min(int(y) + 2 * half + 1, height)
+            if x1 - x0 <= 2 * half or y1 - y0 <= 2 * half:
+                continue
+            patch = cv2.cvtColor(image[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+            point = np.array([[[x - x0, y - y0]]], dtype="float32")
+            cv2.cornerSubPix(patch, point, (half, half), (-1, -1), criteria)
             
-        except Exception as e:
-            print(f"Error processing {image_path}: {str(e)}")
-            return False
+            # Keep the coarse corner if refinement wandered outside its search window
+            candidate = point[0, 0] + (x0, y0)
+            if np.all(np.abs(candidate - (x, y)) <= half):
+                refined[i] = candidate
+        return refined
 
     def _preprocess(self, image):
         """Image preprocessing steps"""
@@ -58,7 +141,7 @@ class ChequeBorderProcessor:
     def _find_border_contour(self, image):
         """Find cheque border contour"""
         contours, _ = cv2.findContours(image, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-        contours = sorted(contours, key=cv2.contourArea, reverse=True)[:5]
+        contours = heapq.nlargest(5, contours, key=cv2.contourArea)
 
         for contour in contours:
             peri = cv2.arcLength(contour, True)
@@ -114,20 +197,149 @@ class ChequeBorderProcessor:
         """Resize image to standard size"""
         return cv2.resize(image, self.output_size, interpolation=cv2.INTER_AREA)
 
-def process_directory(input_dir, output_dir, target_size=(600, 300)):
-    """Process all images in a directory"""
-    processor = ChequeBorderProcessor(output_size=target_size)
-    
+def evaluate_detection_scale(images, detection_max_dim, refine_corners=True):
+    """
+    Compare downscaled border detection against full-resolution detection on the same images
+    :param images: Iterable of BGR ndarrays or PIL images
+    :param detection_max_dim: Longest side of the downscaled copy to evaluate
+    :param refine_corners: Whether to refine the downscaled corners at full resolution
+    :return: Dict with corner error in full-resolution pixels (mean/p95/max), detection counts and speedup
+    """
+    reference = ChequeBorderProcessor()
+    candidate = ChequeBorderProcessor(detection_max_dim=detection_max_dim, refine_corners=refine_corners)
+    errors = []
+    compared = missed = extra = 0
+    full_seconds = scaled_seconds = 0.0
+
+    for image in images:
+        image = reference._to_bgr(image)
+        results = []
+        for processor in (reference, candidate):
+            start = time.perf_counter()
+            try:
+                corners = processor._order_points(processor._detect_border(image).astype("float32"))
+            except ValueError:
+                corners = None
+            elapsed = time.perf_counter() - start
+            results.append(corners)
+            if processor is reference:
+                full_seconds += elapsed
+            else:
+                scaled_seconds += elapsed
+
+        expected, found = results
+        if expected is None:
+            extra += found is not None
+            continue
+        if found is None:
+            missed += 1
+            continue
+        compared += 1
+        errors.extend(np.linalg.norm(found - expected, axis=1))
+
+    errors = np.asarray(errors) if errors else np.zeros(1)
+    return {
+        "detection_max_dim": detection_max_dim,
+        "refine_corners": refine_corners,
+        "compared": compared,
+        "missed": missed,
+        "extra": extra,
+        "mean_corner_error": float(errors.mean()),
+        "p95_corner_error": float(np.percentile(errors, 95)),
+        "max_corner_error": float(errors.max()),
+        "full_seconds": full_seconds,
+        "scaled_seconds": scaled_seconds,
+        "speedup": full_seconds / scaled_seconds if scaled_seconds > 0 else 0.0,
+    }
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Per-process processor kept warm across tasks by the worker pool
+_worker_processor = None
+
+def _init_worker(target_size, detection_max_dim=None):
+    """Create the processor once per pool worker process"""
+    global _worker_processor
+    cv2.setNumThreads(1)  # One image per core; avoid oversubscribing OpenCV threads
+    _worker_processor = ChequeBorderProcessor(output_size=target_size, detection_max_dim=detection_max_dim)
+
+def _run_task(processor, task):
+    """Process one (input_path, output_path) pair, returning (input_path, error message or None)"""
+    input_path, output_path = task
+    try:
+        processor._process_file(input_path, output_path)
+        return input_path, None
+    except Exception as e:
+        return input_path, str(e)
+
+def _process_task(task):
+    """Process one task inside a pool worker"""
+    return _run_task(_worker_processor, task)
+
+def _iter_directory_tasks(input_dir, output_dir):
+    """Yield (input_path, output_path) pairs for the images in a directory"""
+    for filename in sorted(os.listdir(input_dir)):
+        if filename.lower().endswith(IMAGE_EXTENSIONS):
+            yield (os.path.join(input_dir, filename),
+                   os.path.join(output_dir, f"processed_{filename}"))
+
+def process_directory(input_dir, output_dir, target_size=(600, 300), workers=1,
+                      max_pending=None, progress_callback=None, detection_max_dim=None):
+    """
+    Process all images in a directory, optionally across a pool of worker processes
+    :param workers: Number of worker processes (1 processes inline, None uses all cores)
+    :param max_pending: Maximum number of images queued or in flight at once
+    :param progress_callback: Called as progress_callback(done, total, input_path, error)
+    :param detection_max_dim: Longest side to detect borders at (None uses full resolution)
+    :return: Dict with processed/failed counts, per-file failures, elapsed seconds and images/sec
+    """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-        
-    processed_count = 0
-    for filename in os.listdir(input_dir):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            input_path = os.path.join(input_dir, filename)
-            output_path = os.path.join(output_dir, f"processed_{filename}")
-            
-            if processor.process_image(input_path, output_path):
-                processed_count += 1
-                
-    print(f"Successfully processed {processed_count} images")
\ No newline at end of file
+
+    tasks = list(_iter_directory_tasks(input_dir, output_dir))
+    total = len(tasks)
+    failures = []
+    done = 0
+    start = time.perf_counter()
+
+    def record(input_path, error):
+        nonlocal done
+        done += 1
+        if error is not None:
+            failures.append((input_path, error))
+            print(f"Error processing {input_path}: {error}")
+        if progress_callback is not None:
+            progress_callback(done, total, input_path, error)
+
+    if workers == 1:
+        # Inline runs leave OpenCV's threading alone; only pool workers are limited to one thread
+        processor = ChequeBorderProcessor(output_size=target_size, detection_max_dim=detection_max_dim)
+        for task in tasks:
+            record(*_run_task(processor, task))
+    else:
+        workers = workers or os.cpu_count() or 1
+        max_pending = max_pending or workers * 4
+        with Pool(processes=workers, initializer=_init_worker, initargs=(target_size, detection_max_dim)) as pool:
+            # Bounded submission window keeps queued tasks and pending results flat
+            pending = deque()
+            for task in tasks:
+                if len(pending) >= max_pending:
+                    record(*pending.popleft().get())
+                pending.append(pool.apply_async(_process_task, (task,)))
+            while pending:
+                record(*pending.popleft().get())
+
+    elapsed = time.perf_counter() - start
+    processed_count = total - len(failures)
+    throughput = processed_count / elapsed if elapsed > 0 else 0.0
+
+    print(f"Successfully processed {processed_count} images")
+    print(f"Failed: {len(failures)}, elapsed: {elapsed:.2f}s, throughput: {throughput:.2f} images/sec")
+
+    return {
+        "total": total,
+        "processed": processed_count,
+        "failed": failures,
+        "elapsed": elapsed,
+        "images_per_sec": throughput,
+    }
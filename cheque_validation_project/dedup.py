@@ -0,0 +1,149 @@
+# dedup.py
+import os
+import logging
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from banks import bank_code
+from metrics import span, increment
+from queries import CHEQUE_KEY_FIELDS
+from zone_ocr import load_zones, crop_zone
+
+# Image hash: a DCT perceptual hash of each zone below, so cheques printed on the same
+# template still hash apart (a single whole-image hash is dominated by the template)
+HASH_ZONES = ("micr", "amount", "account")
+HASH_ZONE_SIZE = (128, 32)
+HASH_ZONE_COEFFICIENTS = (16, 32)
+HASH_BITS = len(HASH_ZONES) * HASH_ZONE_COEFFICIENTS[0] * HASH_ZONE_COEFFICIENTS[1]
+HASH_VERSION = 1
+
+# Largest fraction of differing hash bits for a stored image to be a duplicate candidate. Re-uploads of
+# the same file hash identically and skip OCR; anything else is only a candidate, because consecutive
+# cheques from one account for the same amount differ by as little as 1-4%, and is confirmed by its
+# extracted cheque key
+DEDUP_MAX_DISTANCE = float(os.getenv("DEDUP_MAX_DISTANCE", "0.10"))
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") == "1"
+
+# Candidates are found through bands of hash bits (locality-sensitive hashing) and then
+# checked exactly; the fixed stride spreads each band across zones and frequencies
+HASH_BANDS = 32
+BAND_BITS = 16
+BAND_PERMUTATION = np.arange(HASH_BITS) * 97 % HASH_BITS
+
+
+def perceptual_hash(image, zones=None):
+    """Perceptual hash of a normalized cheque image (BGR or grayscale ndarray) as a bit array."""
+    zones = zones or load_zones()
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    rows, columns = HASH_ZONE_COEFFICIENTS
+    bits = []
+    for field in HASH_ZONES:
+        zone = crop_zone(gray, zones[field]["box"])
+        small = cv2.resize(zone, HASH_ZONE_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+        low = cv2.dct(small)[:rows, :columns].flatten()
+        # Compare against the median of the AC terms so brightness shifts do not flip bits
+        bits.append(low > np.median(low[1:]))
+    return np.concatenate(bits)
+
+
+def hamming_distance(a, b):
+    """Fraction of differing bits between two hashes."""
+    return np.count_nonzero(a != b) / a.size
+
+
+def same_image(a, b):
+    """Whether two hashes are identical, as for re-uploads of the same file."""
+    return np.array_equal(a, b)
+
+
+def hash_to_hex(image_hash):
+    """Pack a hash bit array into a hex string for storage."""
+    return np.packbits(image_hash).tobytes().hex()
+
+
+def hash_from_hex(value):
+    """Unpack a stored hex string into a hash bit array."""
+    return np.unpackbits(np.frombuffer(bytes.fromhex(value), dtype=np.uint8))[:HASH_BITS].astype(bool)
+
+
+def band_keys(image_hash):
+    """Index keys for the hash bands; near-duplicates share at least one key with high probability."""
+    bands = image_hash[BAND_PERMUTATION[:HASH_BANDS * BAND_BITS]].reshape(HASH_BANDS, BAND_BITS)
+    values = bands.astype(np.int64) @ (1 << np.arange(BAND_BITS, dtype=np.int64))
+    return [(band << BAND_BITS) | int(value) for band, value in enumerate(values)]
+
+
+def cheque_key(cheque_data):
+    """The identifying fields of a cheque, or None when the cheque/account numbers are missing."""
+    key = {field: cheque_data.get(field) or "" for field in CHEQUE_KEY_FIELDS}
+    key["bankCode"] = key["bankCode"] or bank_code(cheque_data.get("bank"))
+    if not key["chequeNumber"] or not key["accountNumber"]:
+        return None
+    return key
+
+
+class DuplicateIndex:
+    def __init__(self, store, max_distance=DEDUP_MAX_DISTANCE):
+        """
+        Finds cheques that were already stored, by image before OCR and by cheque key after extraction
+        :param store: ChequeStore holding the cheques and their image fingerprints
+        :param max_distance: Largest fraction of differing image-hash bits treated as a duplicate
+        """
+        self.store = store
+        self.max_distance = max_distance
+
+    def find_image(self, image_hash):
+        """
+        Return (stored cheque, distance) for the closest stored image within max_distance, or None
+        Only a distance of 0 identifies the cheque; nearer matches are candidates for confirm_image.
+        """
+        with span("dedup_lookup"):
+            best = None
+            for stored_hash, cheque_id in self.store.find_fingerprints(band_keys(image_hash), HASH_VERSION):
+                distance = hamming_distance(image_hash, hash_from_hex(stored_hash))
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (cheque_id, distance)
+            if best is None:
+                return None
+            cheque = self.store.get(best[0])
+        if cheque is None:
+            return None
+        if best[1] == 0:
+            increment("duplicate_images")
+        return cheque, best[1]
+
+    def confirm_image(self, candidate, cheque_data):
+        """Return the candidate cheque from find_image when its cheque key matches the extracted one, or None."""
+        if candidate is None:
+            return None
+        key = cheque_key(cheque_data)
+        if key is None or cheque_key(candidate[0]) != key:
+            return None
+        increment("duplicate_images")
+        return candidate[0]
+
+    def find_cheque(self, cheque_data):
+        """Return the stored cheque with the same bank code, cheque number and account number, or None."""
+        key = cheque_key(cheque_data)
+        if key is None:
+            return None
+        with span("dedup_lookup"):
+            cheque = self.store.find_by_key(key)
+        if cheque is not None:
+            increment("duplicate_cheques")
+        return cheque
+
+    def record(self, image_hash, cheque_id):
+        """Remember the image hash of a stored cheque so re-uploads are caught before OCR."""
+        try:
+            self.store.add_fingerprint({
+                "hash": hash_to_hex(image_hash),
+                "version": HASH_VERSION,
+                "bands": band_keys(image_hash),
+                "cheque_id": cheque_id,
+                "created": datetime.now().isoformat(),
+            })
+        except Exception as e:
+            logging.warning(f"Could not record image fingerprint: {e}")
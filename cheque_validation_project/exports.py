@@ -0,0 +1,139 @@
+# exports.py
+"""
+Streaming exports of stored cheques.
+
+Matching cheques are read from the cheque store in batches (a MongoDB or SQLite cursor) and
+written straight to the output file, so memory stays bounded by one batch however many months
+are exported. Also usable without the app:
+    python exports.py --format parquet --bank "State Bank of India" --output cheques.parquet
+"""
+import io
+import os
+import csv
+import json
+import logging
+import shlex
+import argparse
+import tempfile
+from collections import namedtuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from extraction import FIELDS
+
+# Export settings
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+# Exports larger than this spill from memory to a temporary file while they are built
+EXPORT_SPOOL_BYTES = int(os.getenv("EXPORT_SPOOL_BYTES", str(16 * 1024 * 1024)))
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+# The Dashboard builds exports up to this many rows; larger ones are left to this script
+EXPORT_APP_MAX_ROWS = int(os.getenv("EXPORT_APP_MAX_ROWS", "50000"))
+
+# Columns of the tabular formats; JSON Lines keeps every stored field
+EXPORT_FIELDS = FIELDS + ["bankCode", "micrCode", "timestamp", "imageKey"]
+
+
+def _value(value):
+    """Column value as text (None stays None)."""
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+def write_csv(batches, f):
+    """Write cheque batches to a binary file as CSV."""
+    text = io.TextIOWrapper(f, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_FIELDS)
+    for batch in batches:
+        writer.writerows([_value(cheque.get(field)) or "" for field in EXPORT_FIELDS] for cheque in batch)
+    # Leave the underlying file open for the caller
+    text.detach()
+
+
+def write_jsonl(batches, f):
+    """Write cheque batches to a binary file as JSON Lines."""
+    for batch in batches:
+        f.write("".join(json.dumps(cheque, ensure_ascii=False, default=str) + "\n" for cheque in batch).encode("utf-8"))
+
+
+def write_parquet(batches, f):
+    """Write cheque batches to a binary file as compressed Parquet, one row group per batch."""
+    schema = pa.schema([(field, pa.string()) for field in EXPORT_FIELDS])
+    with pq.ParquetWriter(f, schema, compression=PARQUET_COMPRESSION) as writer:
+        for batch in batches:
+            columns = {field: [_value(cheque.get(field)) for cheque in batch] for field in EXPORT_FIELDS}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+
+
+ExportFormat = namedtuple("ExportFormat", ["label", "extension", "mime", "writer"])
+
+EXPORT_FORMATS = {
+    "csv": ExportFormat("CSV", ".csv", "text/csv", write_csv),
+    "jsonl": ExportFormat("JSON Lines", ".jsonl", "application/x-ndjson", write_jsonl),
+    "parquet": ExportFormat("Parquet", ".parquet", "application/vnd.apache.parquet", write_parquet),
+}
+
+
+def export_cheques(store, bank, search, export_format, f=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Stream the cheques matching the Dashboard filters into an export file
+    :param store: ChequeStore to read from
+    :param bank: Bank filter ("All" or None for every bank)
+    :param search: Cheque/account number prefix or payee text
+    :param export_format: Key of EXPORT_FORMATS
+    :param f: Binary file to write to; by default a temporary file that spills to disk when large
+    :return: The file, rewound to the start when it was created here
+    """
+    writer = EXPORT_FORMATS[export_format].writer
+    created = f is None
+    if created:
+        f = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+
+    rows = 0
+
+    def counted(batches):
+        nonlocal rows
+        for batch in batches:
+            rows += len(batch)
+            yield batch
+
+    writer(counted(store.iter_batches(bank, search, batch_size)), f)
+    logging.info(f"Exported {rows} cheque(s) as {export_format}")
+    if created:
+        f.seek(0)
+    return f
+
+
+def export_command(bank, search, export_format):
+    """Shell command that runs the same export with this script, for exports too large for the app."""
+    command = ["python", "exports.py", "--format", export_format]
+    if bank and bank != "All":
+        command += ["--bank", bank]
+    if search and search.strip():
+        command += ["--search", search]
+    command += ["--output", f"filtered_cheque_data{EXPORT_FORMATS[export_format].extension}"]
+    return " ".join(shlex.quote(arg) for arg in command)
+
+
+def main():
+    from storage import get_cheque_store
+
+    parser = argparse.ArgumentParser(description="Export stored cheques.")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv", help="export format")
+    parser.add_argument("--bank", help="only cheques from this bank")
+    parser.add_argument("--search", help="cheque/account number prefix or payee text")
+    parser.add_argument("--output", required=True, help="file to write")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE, help="cheques read per batch")
+    args = parser.parse_args()
+
+    store, connection_status = get_cheque_store()
+    if store is None:
+        parser.exit(1, f"{connection_status}\n")
+    with open(args.output, "wb") as f:
+        export_cheques(store, args.bank, args.search, args.format, f, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# extraction.py
+import os
+import re
+from datetime import datetime
+from collections import namedtuple
+
+from metrics import span
+
+# Gemini is only called when the local confidence falls below this threshold
+LOCAL_EXTRACTION_THRESHOLD = float(os.getenv("LOCAL_EXTRACTION_THRESHOLD", "0.85"))
+
+# Output fields, matching the keys requested from Gemini
+FIELDS = ["chequeNumber", "accountNumber", "amount in numbers", "amount in words", "date", "payee", "bank"]
+
+LocalExtraction = namedtuple("LocalExtraction", ["data", "confidence", "field_confidence"])
+
+# Precompiled patterns
+MICR_LABEL_PATTERN = re.compile(r"MICR[:\s]*(\d{6})\b", re.IGNORECASE)
+MICR_LINE_PATTERN = re.compile(r"(?<!\d)(\d{6})\s+(\d{9})\s+(\d{6})\s+(\d{2})(?!\d)")
+CHEQUE_NUMBER_LABEL_PATTERN = re.compile(r"(?:Cheque|Chq)\.?\s*No\.?[:\s]*(\d{6,12})\b", re.IGNORECASE)
+CHEQUE_NUMBER_PATTERN = re.compile(r"\b(\d{6})\b")
+# "A/c" is often read as "Alc" or "A1c"; zone output repeats the label
+ACCOUNT_LABEL_PATTERN = re.compile(r"(?:A[/l1I]?c(?:count)?\.?\s*No\.?[:\s]*)+(\d[\d ]{8,20}\d)", re.IGNORECASE)
+ACCOUNT_PATTERN = re.compile(r"\b(\d{10,16})\b")
+AMOUNT_NUMBERS_PATTERN = re.compile(
+    r"(?:Rs\.?|INR|₹|Amount(?:\s*Rs\.?)?)[:\s]*"
+    r"((?:\d{1,2}(?:,\d{2})*,\d{3}|\d{1,3}(?:,\d{3})+|\d+)(?:\.\d{1,2})?)",
+    re.IGNORECASE,
+)
+AMOUNT_BARE_PATTERN = re.compile(r"\b((?:\d{1,2}(?:,\d{2})*,\d{3}|\d{1,3}(?:,\d{3})+|\d+)\.\d{2})\b")
+INDIAN_GROUPING_PATTERN = re.compile(r"^\d{1,2}(?:,\d{2})*,\d{3}(?:\.\d{1,2})?$|^\d{1,3}(?:\.\d{1,2})?$")
+WESTERN_GROUPING_PATTERN = re.compile(r"^\d{1,3}(?:,\d{3})+(?:\.\d{1,2})?$|^\d+(?:\.\d{1,2})?$")
+AMOUNT_WORDS_PATTERN = re.compile(r"(?:(?:Rupees|INR)[:\s]+)+([A-Za-z][A-Za-z\s-]*?)(?:\s*Only\b|$)", re.IGNORECASE | re.MULTILINE)
+PAYEE_PATTERN = re.compile(r"(?:\bPay(?:\s+to|ee)?[:\s]+)+([A-Za-z][A-Za-z .&'-]*?)\s*(?:\bor\s+(?:bearer|order)\b|$)", re.IGNORECASE | re.MULTILINE)
+BANK_PATTERN = re.compile(r"(?:Bank[:\s]+)?([A-Za-z][A-Za-z .&'-]*\bBank\b(?:\s+(?:of\s+[A-Za-z]+|Ltd\.?|Limited))?)", re.IGNORECASE)
+
+MONTHS = r"(?:Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?|Aug(?:ust)?|Sep(?:t(?:ember)?)?|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)"
+# (pattern, normalized template, strptime formats) for the date formats listed in the Gemini prompt
+DATE_PATTERNS = [
+    (re.compile(r"(?<!\d)(\d{4})-(\d{2})-(\d{2})(?!\d)"), "{0}-{1}-{2}", ["%Y-%m-%d"]),
+    (re.compile(r"(?<!\d)(\d{2})\s*[-/ ]\s*(\d{2})\s*[-/ ]\s*(\d{4})(?!\d)"), "{0}-{1}-{2}", ["%d-%m-%Y"]),
+    (re.compile(rf"(?<!\d)(\d{{1,2}})(?:st|nd|rd|th)?\s*[-/ ]\s*({MONTHS})\s*[-/ ,]\s*(\d{{4}})\b", re.IGNORECASE),
+     "{0} {1} {2}", ["%d %B %Y", "%d %b %Y"]),
+    (re.compile(rf"\b({MONTHS})\s+(\d{{1,2}})(?:st|nd|rd|th)?,?\s+(\d{{4}})\b", re.IGNORECASE),
+     "{1} {0} {2}", ["%d %B %Y", "%d %b %Y"]),
+]
+
+NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15,
+    "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19, "twenty": 20, "thirty": 30,
+    "forty": 40, "fourty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+}
+SCALE_WORDS = {
+    "thousand": 1_000, "lakh": 100_000, "lakhs": 100_000, "lac": 100_000, "lacs": 100_000,
+    "million": 1_000_000, "crore": 10_000_000, "crores": 10_000_000,
+}
+FILLER_WORDS = {"rupees", "rupee", "rs", "inr", "only", "and"}
+WORD_PATTERN = re.compile(r"[a-z]+")
+
+
+def parse_amount_numbers(value):
+    """Parse an amount such as 1,23,500.00 or 123,500 into a float, or None."""
+    try:
+        return float(value.replace(",", ""))
+    except (AttributeError, ValueError):
+        return None
+
+
+def _words_to_int(tokens):
+    """Convert number words (Indian or international scales) into an integer, or None."""
+    total, current, seen = 0, 0, False
+    for token in tokens:
+        if token in NUMBER_WORDS:
+            current += NUMBER_WORDS[token]
+        elif token == "hundred":
+            current = (current or 1) * 100
+        elif token in SCALE_WORDS:
+            total += (current or 1) * SCALE_WORDS[token]
+            current = 0
+        elif token in FILLER_WORDS:
+            continue
+        else:
+            return None
+        seen = True
+    return total + current if seen else None
+
+
+def words_to_amount(words):
+    """Convert an amount in words (e.g. "One Lakh Twenty Three Thousand Five Hundred Only") into a float."""
+    tokens = WORD_PATTERN.findall((words or "").lower())
+    paise = 0
+    if "paise" in tokens:
+        end = tokens.index("paise")
+        start = max((i for i, token in enumerate(tokens[:end]) if token == "and"), default=None)
+        if start is None:
+            return None
+        paise = _words_to_int(tokens[start + 1:end])
+        tokens = tokens[:start]
+        if paise is None:
+            return None
+    rupees = _words_to_int(tokens)
+    return None if rupees is None else rupees + paise / 100
+
+
+def parse_date(text):
+    """Find the first date in any supported format and return it as DD-MM-YYYY, or None."""
+    for pattern, template, formats in DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            candidate = template.format(*match.groups())
+            for date_format in formats:
+                try:
+                    return datetime.strptime(candidate, date_format).strftime("%d-%m-%Y")
+                except ValueError:
+                    continue
+    return None
+
+
+def _extract_cheque_number(text, micr):
+    if micr:
+        return micr.group(1), 0.95
+    match = CHEQUE_NUMBER_LABEL_PATTERN.search(text)
+    if match:
+        return match.group(1), 0.85
+    match = CHEQUE_NUMBER_PATTERN.search(text)
+    return (match.group(1), 0.4) if match else ("", 0.0)
+
+
+def _extract_account_number(text, micr_line):
+    # The MICR line ends with the account's last six digits; a number that disagrees was probably misread
+    short_account = micr_line.group(3) if micr_line else None
+    match = ACCOUNT_LABEL_PATTERN.search(text)
+    if match:
+        digits = match.group(1).replace(" ", "")
+        if 10 <= len(digits) <= 16:
+            if short_account is None:
+                return digits, 0.9
+            return digits, 0.95 if digits.endswith(short_account) else 0.5
+    if short_account is not None:
+        for match in ACCOUNT_PATTERN.finditer(text):
+            if match.group(1).endswith(short_account):
+                return match.group(1), 0.85
+    match = ACCOUNT_PATTERN.search(text)
+    return (match.group(1), 0.5) if match else ("", 0.0)
+
+
+def _extract_amounts(text):
+    """Extract both amounts and score them, cross-checking words against numbers."""
+    match = AMOUNT_NUMBERS_PATTERN.search(text) or AMOUNT_BARE_PATTERN.search(text)
+    numbers = match.group(1) if match else ""
+    match = AMOUNT_WORDS_PATTERN.search(text)
+    words = " ".join(match.group(1).split()) if match else ""
+
+    number_value = parse_amount_numbers(numbers)
+    words_value = words_to_amount(words)
+
+    numbers_confidence = 0.0
+    if number_value is not None:
+        well_formed = INDIAN_GROUPING_PATTERN.match(numbers) or WESTERN_GROUPING_PATTERN.match(numbers)
+        numbers_confidence = 0.7 if well_formed else 0.4
+    words_confidence = 0.6 if words_value is not None else (0.2 if words else 0.0)
+
+    if number_value is not None and words_value is not None:
+        if abs(number_value - words_value) < 0.005:
+            numbers_confidence = words_confidence = 1.0
+        else:
+            numbers_confidence = words_confidence = 0.3
+
+    if number_value is not None:
+        numbers = f"{number_value:.2f}"
+    if words:
+        words = f"{words} Only"
+    return (numbers, numbers_confidence), (words, words_confidence)
+
+
+def _extract_payee(text):
+    match = PAYEE_PATTERN.search(text)
+    if match and len(match.group(1).strip()) >= 3:
+        return match.group(1).strip(), 0.85
+    return "", 0.0
+
+
+def _extract_bank(text):
+    match = BANK_PATTERN.search(text)
+    if match:
+        return " ".join(match.group(1).split()), 0.85
+    return "", 0.0
+
+
+def extract_with_confidence(text):
+    """Extract cheque fields from OCR text with a 0-1 confidence score per field."""
+    with span("local_extraction"):
+        return _extract_with_confidence(text or "")
+
+
+def _extract_with_confidence(text):
+    micr_line = MICR_LINE_PATTERN.search(text)
+    micr = MICR_LABEL_PATTERN.search(text) or micr_line
+    date = parse_date(text)
+    amount_numbers, amount_words = _extract_amounts(text)
+
+    results = {
+        "chequeNumber": _extract_cheque_number(text, micr),
+        "accountNumber": _extract_account_number(text, micr_line),
+        "amount in numbers": amount_numbers,
+        "amount in words": amount_words,
+        "date": (date, 0.9) if date else ("", 0.0),
+        "payee": _extract_payee(text),
+        "bank": _extract_bank(text),
+    }
+    data = {field: results[field][0] for field in FIELDS}
+    field_confidence = {field: results[field][1] for field in FIELDS}
+    return LocalExtraction(data, min(field_confidence.values()), field_confidence)
+
+
+def is_confident(extraction, threshold=LOCAL_EXTRACTION_THRESHOLD):
+    """True when every field is confident enough to skip Gemini."""
+    return extraction.confidence >= threshold
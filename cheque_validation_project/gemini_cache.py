@@ -0,0 +1,140 @@
+# gemini_cache.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# Cache settings
+CACHE_PATH = os.getenv("GEMINI_CACHE_PATH", "gemini_cache.db")
+CACHE_MEMORY_ITEMS = int(os.getenv("GEMINI_CACHE_MEMORY_ITEMS", "1024"))
+CACHE_MAX_BYTES = int(os.getenv("GEMINI_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+
+def normalize_text(text):
+    """Normalize OCR text so cosmetic differences map to the same key."""
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.split())
+
+
+def make_cache_key(text, prompt_version, model_name):
+    """Build a content-addressed key from the OCR text and the prompt/model version."""
+    payload = "\0".join([normalize_text(text), prompt_version, model_name])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GeminiResultCache:
+    def __init__(self, path=CACHE_PATH, memory_items=CACHE_MEMORY_ITEMS,
+                 max_bytes=CACHE_MAX_BYTES, ttl_seconds=CACHE_TTL_SECONDS):
+        """
+        Two-tier cache for refined cheque data
+        :param path: SQLite file for the persistent tier (None disables it)
+        :param memory_items: Maximum entries held in the in-process LRU tier
+        :param max_bytes: Size budget for the persistent tier
+        :param ttl_seconds: Age after which persistent entries expire
+        """
+        self.path = path
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _db(self):
+        """Open the persistent tier on first use."""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS gemini_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_gemini_cache_accessed ON gemini_cache (accessed)")
+            self._conn.commit()
+        return self._conn
+
+    def _remember(self, key, value):
+        """Insert into the LRU tier, dropping the least recently used entry when full."""
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return json.loads(self._memory[key])
+
+            if self.path is not None:
+                try:
+                    conn = self._db()
+                    row = conn.execute(
+                        "SELECT value FROM gemini_cache WHERE key = ? AND created >= ?",
+                        (key, time.time() - self.ttl_seconds),
+                    ).fetchone()
+                    if row is not None:
+                        conn.execute("UPDATE gemini_cache SET accessed = ? WHERE key = ?", (time.time(), key))
+                        conn.commit()
+                        self._remember(key, row[0])
+                        self.stats["disk_hits"] += 1
+                        return json.loads(row[0])
+                except sqlite3.Error as e:
+                    logging.warning(f"Gemini cache read failed: {e}")
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key, value):
+        """Store a JSON-serializable value in both tiers."""
+        encoded = json.dumps(value)
+        with self._lock:
+            self._remember(key, encoded)
+            self.stats["stores"] += 1
+            if self.path is None:
+                return
+            try:
+                conn = self._db()
+                now = time.time()
+                conn.execute(
+                    "INSERT OR REPLACE INTO gemini_cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, encoded, len(encoded), now, now),
+                )
+                self._evict(conn, now)
+                conn.commit()
+            except sqlite3.Error as e:
+                logging.warning(f"Gemini cache write failed: {e}")
+
+    def _evict(self, conn, now):
+        """Drop expired entries, then least recently accessed ones until under the size budget."""
+        evicted = conn.execute("DELETE FROM gemini_cache WHERE created < ?", (now - self.ttl_seconds,)).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM gemini_cache").fetchone()[0]
+        if total > self.max_bytes:
+            rows = conn.execute("SELECT key, size FROM gemini_cache ORDER BY accessed").fetchall()
+            stale = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                stale.append((key,))
+                total -= size
+            conn.executemany("DELETE FROM gemini_cache WHERE key = ?", stale)
+            evicted += len(stale)
+        self.stats["evictions"] += evicted
+
+    def clear(self):
+        """Remove every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self.path is not None:
+                conn = self._db()
+                conn.execute("DELETE FROM gemini_cache")
+                conn.commit()
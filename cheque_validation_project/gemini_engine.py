@@ -0,0 +1,297 @@
+# gemini_engine.py
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from metrics import span, increment
+from extraction import FIELDS
+from gemini_cache import GeminiResultCache, make_cache_key
+
+# Load environment variables
+load_dotenv()
+
+# Gemini settings; bump PROMPT_VERSION whenever the prompts change so cached results are not reused
+GEMINI_MODEL = "gemini-2.0-flash"
+PROMPT_VERSION = "1"
+
+# Optional API endpoint override, e.g. a local stub server for testing (uses the REST transport)
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+# Concurrency and quota settings
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60"))
+GEMINI_BATCH_SIZE = int(os.getenv("GEMINI_BATCH_SIZE", "1"))
+# Seconds a submitted cheque waits for others to fill its batch
+GEMINI_BATCH_WAIT = float(os.getenv("GEMINI_BATCH_WAIT", "0.5"))
+
+CHEQUE_FIELDS_PROMPT = """
+Extract and structure the following cheque details in JSON format with the fields below. The extracted text is messy and fragmented, so carefully analyze and connect the relevant parts to extract the correct values. If a field is not found, leave it as an empty string (""), not null.
+
+Fields:
+- chequeNumber: The cheque number (a numeric value, typically 6-12 digits).
+- accountNumber: The account number (a numeric value, typically 10-16 digits).
+- amount in numbers: The amount in numeric format (e.g., 1000.00).
+- amount in words: The amount in words (e.g., "One thousand only").
+- date: The date on the cheque. It can be in any of the following formats:
+  - `DD-MM-YYYY` (e.g., 10-02-2015)
+  - `DD/MM/YYYY` (e.g., 10/02/2015)
+  - `DD MM YYYY` (e.g., 10 02 2015)
+  - `DDth Month YYYY` (e.g., 10th February 2015)
+  - `Month DD, YYYY` (e.g., February 10, 2015)
+  - `YYYY-MM-DD` (e.g., 2015-02-10)
+  - Abbreviated formats (e.g., 10-Feb-2015 or 10/Feb/2015)
+  If the date is fragmented or mixed with other text (e.g., "Date_10- 02-15" or "10-02-2015 fests"), extract only the date part.
+- payee: The name of the payee (the person or entity to whom the cheque is issued).
+- bank: The name of the bank (e.g., "State Bank of India").
+
+"""
+
+CHEQUE_PROMPT = CHEQUE_FIELDS_PROMPT + """
+Now, extract the details from the following extracted text:
+{extracted_text}
+"""
+
+BATCH_PROMPT = CHEQUE_FIELDS_PROMPT + """
+The text below contains {count} separate cheques. Each one starts with a line of the form "### CHEQUE <n> ###".
+Return a JSON array with exactly {count} objects, one per cheque, in the same order.
+
+{cheques}
+"""
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """Configure Gemini once and return the shared model object (None if no API key is set)."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                api_key = os.getenv("GEMINI_API_KEY")
+                if not api_key:
+                    logging.error("❌ Gemini API Key not found! Please set the GEMINI_API_KEY environment variable.")
+                    return None
+
+                # The client library takes about a second to import, so it loads on first use
+                import google.generativeai as gen_ai
+
+                if GEMINI_API_ENDPOINT:
+                    gen_ai.configure(api_key=api_key, transport="rest",
+                                     client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+                else:
+                    gen_ai.configure(api_key=api_key)
+                _model = gen_ai.GenerativeModel(GEMINI_MODEL)
+    return _model
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        """
+        Blocking token-bucket rate limiter
+        :param rate: Tokens added per second
+        :param capacity: Maximum burst size (defaults to one second of tokens, at least 1)
+        """
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _response_text(response):
+    """Pull the text of the first candidate out of a Gemini response, stripped of code fences."""
+    if response and hasattr(response, "candidates") and response.candidates:
+        candidate = response.candidates[0]
+
+        if hasattr(candidate, "content") and hasattr(candidate.content, "parts") and candidate.content.parts:
+            refined_text = candidate.content.parts[0].text
+            return refined_text.replace("```json", "").replace("```", "").strip()
+    return None
+
+
+def _is_cheque(result):
+    """Whether a parsed batch element is a cheque object with the requested fields."""
+    return isinstance(result, dict) and all(field in result for field in FIELDS)
+
+
+class GeminiRefiner:
+    def __init__(self, max_concurrency=GEMINI_MAX_CONCURRENCY, requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+                 batch_size=GEMINI_BATCH_SIZE, batch_wait=GEMINI_BATCH_WAIT, cache=None):
+        """
+        Concurrent, rate-limited Gemini refinement
+        :param max_concurrency: Maximum number of requests in flight
+        :param requests_per_minute: Request quota enforced with a token bucket
+        :param batch_size: Number of cheques packed into a single request by submit and refine_many
+        :param batch_wait: Seconds a submitted cheque waits for a full batch before it is sent anyway
+        :param cache: Optional GeminiResultCache consulted before calling the API
+        """
+        self.max_concurrency = max_concurrency
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.cache = cache
+        self._bucket = TokenBucket(requests_per_minute / 60.0)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="gemini")
+        # Submitted (text, use_cache, future) entries waiting to fill a batch
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._timer = None
+
+    def _generate(self, prompt):
+        """Send one rate-limited request and return the response text."""
+        model = get_model()
+        if model is None:
+            return None
+        self._bucket.acquire()
+        with span("gemini"):
+            return _response_text(model.generate_content(prompt))
+
+    def _call(self, extracted_text):
+        """Refine a single cheque's text without consulting the cache."""
+        try:
+            refined_text = self._generate(CHEQUE_PROMPT.format(extracted_text=extracted_text))
+            if refined_text is None:
+                increment("gemini_failures")
+                logging.warning("Gemini returned an empty response.")
+                return None
+            try:
+                cheque_data = json.loads(refined_text)
+            except json.JSONDecodeError as e:
+                increment("gemini_failures")
+                logging.error(f"Error parsing JSON: {e}")
+                return None
+            if not isinstance(cheque_data, dict):
+                increment("gemini_failures")
+                logging.error("Gemini returned JSON that is not a cheque object.")
+                return None
+            return cheque_data
+        except Exception as e:
+            increment("gemini_failures")
+            logging.error(f"Error with Gemini API: {e}")
+            return None
+
+    def _call_batch(self, texts):
+        """
+        Refine several cheques in one request, falling back to single calls if the reply is unusable;
+        elements that are not cheque objects with the requested fields are retried individually
+        """
+        if len(texts) == 1:
+            return [self._call(texts[0])]
+        cheques = "\n\n".join(f"### CHEQUE {i + 1} ###\n{text}" for i, text in enumerate(texts))
+        try:
+            refined_text = self._generate(BATCH_PROMPT.format(count=len(texts), cheques=cheques))
+            results = json.loads(refined_text) if refined_text else None
+            if isinstance(results, list) and len(results) == len(texts):
+                malformed = sum(not _is_cheque(result) for result in results)
+                if malformed:
+                    increment("gemini_batch_fallbacks", malformed)
+                    logging.warning(f"{malformed} cheque(s) of a Gemini batch response were malformed; "
+                                    f"retrying them individually.")
+                return [result if _is_cheque(result) else self._call(text) for text, result in zip(texts, results)]
+            increment("gemini_batch_fallbacks", len(texts))
+            logging.warning("Gemini batch response did not match the request; retrying individually.")
+        except Exception as e:
+            increment("gemini_batch_fallbacks", len(texts))
+            logging.error(f"Error with Gemini batch request: {e}")
+        return [self._call(text) for text in texts]
+
+    def _refine_batch(self, entries):
+        """Resolve the futures of (text, use_cache, future) entries with one batched request for the cache misses."""
+        try:
+            misses = []
+            for text, use_cache, future in entries:
+                cached = self.cache.get(self._cache_key(text)) if use_cache and self.cache is not None else None
+                if cached is not None:
+                    increment("gemini_cache_hits")
+                    future.set_result(cached)
+                else:
+                    misses.append((text, use_cache, future))
+            if not misses:
+                return
+            results = self._call_batch([text for text, _, _ in misses])
+            for (text, use_cache, future), cheque_data in zip(misses, results):
+                if use_cache and self.cache is not None and cheque_data is not None:
+                    self.cache.set(self._cache_key(text), cheque_data)
+                future.set_result(cheque_data)
+        except Exception as e:
+            for _, _, future in entries:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _cache_key(self, extracted_text):
+        return make_cache_key(extracted_text, PROMPT_VERSION, GEMINI_MODEL)
+
+    def refine(self, extracted_text, use_cache=True):
+        """Refine a single cheque's OCR text, reusing a cached result when available."""
+        use_cache = use_cache and self.cache is not None
+        if use_cache:
+            cached = self.cache.get(self._cache_key(extracted_text))
+            if cached is not None:
+                increment("gemini_cache_hits")
+                logging.info("Gemini cache hit")
+                return cached
+
+        cheque_data = self._call(extracted_text)
+        if use_cache and cheque_data is not None:
+            self.cache.set(self._cache_key(extracted_text), cheque_data)
+        return cheque_data
+
+    def submit(self, extracted_text, use_cache=True):
+        """
+        Schedule refinement on the worker pool and return a Future
+        With batch_size > 1 the text joins a batch that is sent once full, after batch_wait seconds, or on flush().
+        """
+        if self.batch_size == 1:
+            return self._executor.submit(self.refine, extracted_text, use_cache)
+        future = Future()
+        with self._pending_lock:
+            self._pending.append((extracted_text, use_cache, future))
+            if len(self._pending) >= self.batch_size:
+                self._send_pending()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.batch_wait, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return future
+
+    def _send_pending(self):
+        """Hand the waiting entries to the worker pool in batches; the caller holds _pending_lock."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        for i in range(0, len(pending), self.batch_size):
+            self._executor.submit(self._refine_batch, pending[i:i + self.batch_size])
+
+    def flush(self):
+        """Send the submitted cheques still waiting for their batch to fill."""
+        with self._pending_lock:
+            self._send_pending()
+
+    def refine_many(self, texts, use_cache=True):
+        """Refine many cheques concurrently (batched when batch_size > 1), preserving input order."""
+        futures = [self.submit(text, use_cache) for text in texts]
+        self.flush()
+        return [future.result() for future in futures]
+
+
+# Shared refiner used by utils and the Streamlit pages
+gemini_refiner = GeminiRefiner(cache=GeminiResultCache())
@@ -0,0 +1,298 @@
+# jobs.py
+"""
+Persistent cheque processing queue shared by every Streamlit session.
+
+The upload page enqueues files and polls the job/page status tables; a pool of local worker
+processes claims jobs and runs them through the pipeline. Workers start with the app
+(JOBS_WORKERS) or separately:
+    python jobs.py --workers 4
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import argparse
+import threading
+import multiprocessing
+
+# Queue settings
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.db")
+JOBS_SPOOL_DIR = os.getenv("JOBS_SPOOL_DIR", "job_uploads")
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "1.0"))
+# Running jobs without a heartbeat for this long are assumed lost with their worker and requeued
+JOBS_STALE_SECONDS = float(os.getenv("JOBS_STALE_SECONDS", "600"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total_pages INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    heartbeat REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created);
+CREATE TABLE IF NOT EXISTS job_pages (
+    job_id TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    note TEXT,
+    data TEXT,
+    image_path TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (job_id, page)
+);
+"""
+
+
+class JobQueue:
+    def __init__(self, path=JOBS_DB_PATH, spool_dir=JOBS_SPOOL_DIR):
+        """
+        SQLite-backed job queue; safe to use from several threads and processes at once
+        :param path: SQLite file holding the job and page status tables
+        :param spool_dir: Directory where uploaded files wait for a worker
+        """
+        self.path = path
+        self.spool_dir = spool_dir
+        self._local = threading.local()
+
+    def _db(self):
+        """Open this thread's connection and create the tables on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, filename, content_type, data):
+        """Spool an uploaded file and queue it; returns the job id."""
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = os.path.join(self.spool_dir, job_id + os.path.splitext(filename)[1].lower())
+        with open(path, "wb") as f:
+            f.write(data)
+        self._db().execute(
+            "INSERT INTO jobs (id, filename, content_type, path, status, created) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, filename, content_type, path, QUEUED, time.time()),
+        )
+        logging.info(f"Queued job {job_id} for {filename}")
+        return job_id
+
+    def claim(self, worker):
+        """Atomically take the oldest queued job for a worker, or return None."""
+        conn = self._db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, started = ?, heartbeat = ? "
+                "WHERE id = ?",
+                (RUNNING, worker, now, now, row["id"]),
+            )
+            # A retried job starts its pages over
+            conn.execute("DELETE FROM job_pages WHERE job_id = ?", (row["id"],))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return dict(row)
+
+    def requeue_stale(self, max_age=JOBS_STALE_SECONDS, max_attempts=JOBS_MAX_ATTEMPTS):
+        """Requeue running jobs whose worker stopped sending heartbeats; fail them after max_attempts."""
+        conn = self._db()
+        cutoff = time.time() - max_age
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = 'Worker stopped responding', finished = ? "
+            "WHERE status = ? AND heartbeat < ? AND attempts >= ?",
+            (FAILED, time.time(), RUNNING, cutoff, max_attempts),
+        )
+        requeued = conn.execute(
+            "UPDATE jobs SET status = ?, worker = NULL WHERE status = ? AND heartbeat < ?",
+            (QUEUED, RUNNING, cutoff),
+        ).rowcount
+        if requeued:
+            logging.warning(f"Requeued {requeued} job(s) from unresponsive workers")
+        return requeued
+
+    def set_total_pages(self, job_id, total_pages):
+        self._db().execute(
+            "UPDATE jobs SET total_pages = ?, heartbeat = ? WHERE id = ?", (total_pages, time.time(), job_id)
+        )
+
+    def update_page(self, job_id, page, status, note=None, data=None, image_path=None):
+        """Record a page's status (and refresh the job heartbeat)."""
+        now = time.time()
+        conn = self._db()
+        conn.execute(
+            "INSERT INTO job_pages (job_id, page, status, note, data, image_path, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (job_id, page) DO UPDATE SET status = excluded.status, "
+            "note = COALESCE(excluded.note, note), data = COALESCE(excluded.data, data), "
+            "image_path = COALESCE(excluded.image_path, image_path), updated = excluded.updated",
+            (job_id, page, status, note, json.dumps(data) if data is not None else None, image_path, now),
+        )
+        conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (now, job_id))
+
+    def finish(self, job_id, error=None):
+        """Mark a job done (or failed) and remove its spooled upload."""
+        job = self.get_job(job_id)
+        self._db().execute(
+            "UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ?",
+            (FAILED if error else DONE, error, time.time(), job_id),
+        )
+        if job is not None and os.path.exists(job["path"]):
+            os.remove(job["path"])
+
+    def get_job(self, job_id):
+        row = self._db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def get_pages(self, job_id):
+        """Page status records of a job in page order, with data decoded."""
+        rows = self._db().execute(
+            "SELECT * FROM job_pages WHERE job_id = ? ORDER BY page", (job_id,)
+        ).fetchall()
+        pages = []
+        for row in rows:
+            page = dict(row)
+            page["data"] = json.loads(page["data"]) if page["data"] else None
+            pages.append(page)
+        return pages
+
+    def queue_position(self, job_id):
+        """Number of queued jobs ahead of this one (0 when it is next or already running)."""
+        job = self.get_job(job_id)
+        if job is None or job["status"] != QUEUED:
+            return 0
+        return self._db().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ? AND created < ?", (QUEUED, job["created"])
+        ).fetchone()[0]
+
+
+def run_job(queue, job):
+    """Run one claimed job through the pipeline, recording page progress as it goes."""
+    import pipeline
+    from storage import get_cheque_store
+    from artifacts import get_artifact_store
+
+    job_id = job["id"]
+    logging.info(f"Processing job {job_id} ({job['filename']})")
+    try:
+        queue.set_total_pages(job_id, pipeline.count_pages(job["path"], job["content_type"]))
+        store, connection_status = get_cheque_store()
+        if store is None:
+            logging.error(f"Job {job_id} runs without a database: {connection_status}")
+
+        # Cropped pages go to the artifact store; the upload page previews them from there
+        artifacts = get_artifact_store()
+
+        def on_page(page, image_key, note):
+            image_path = artifacts.path(image_key) if image_key is not None else None
+            queue.update_page(job_id, page, RUNNING, note=note, image_path=image_path)
+
+        for result in pipeline.process_document(job["path"], job["content_type"], job["filename"], store, on_page,
+                                                artifacts=artifacts):
+            queue.update_page(job_id, result.page, result.status, note=result.note, data=result.data)
+        queue.finish(job_id)
+        logging.info(f"Finished job {job_id}")
+    except Exception as e:
+        logging.error(f"Job {job_id} failed: {e}")
+        queue.finish(job_id, error=str(e))
+
+
+def run_worker(worker_number=0, workers=1, path=JOBS_DB_PATH, poll_interval=JOBS_POLL_INTERVAL):
+    """Worker process loop: claim and run jobs until the process is stopped."""
+    # The Gemini quota is shared by the whole pool; set before the pipeline imports gemini_engine
+    requests_per_minute = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60"))
+    os.environ["GEMINI_REQUESTS_PER_MINUTE"] = str(requests_per_minute / max(workers, 1))
+
+    from utils import configure_logging
+    configure_logging()
+
+    # The worker's main thread, the only one allowed to import tesserocr
+    from ocr_engine import load_ocr_engine
+    load_ocr_engine()
+
+    from metrics import METRICS_PORT, METRICS_FILE, METRICS_FILE_INTERVAL, start_metrics_server, write_metrics_file
+    if METRICS_PORT:
+        # Each worker exposes its own metrics on the next ports after the app's
+        start_metrics_server(int(METRICS_PORT) + 1 + worker_number)
+
+    queue = JobQueue(path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    logging.info(f"Job worker {worker} started")
+    metrics_written = None
+    while True:
+        if METRICS_FILE and (metrics_written is None or time.monotonic() - metrics_written >= METRICS_FILE_INTERVAL):
+            write_metrics_file(worker=f"worker-{worker_number}")
+            metrics_written = time.monotonic()
+        queue.requeue_stale()
+        job = queue.claim(worker)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        run_job(queue, job)
+
+
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def start_workers(count=JOBS_WORKERS, path=JOBS_DB_PATH):
+    """Start the local worker pool once per process (no-op when count is 0)."""
+    with _workers_lock:
+        if count <= 0 or any(process.is_alive() for process in _workers):
+            return _workers
+        # Spawned, not forked: the app process has threads and native handles that must not be copied
+        context = multiprocessing.get_context("spawn")
+        _workers[:] = [
+            context.Process(target=run_worker, args=(n, count, path), daemon=True, name=f"cheque-worker-{n}")
+            for n in range(count)
+        ]
+        for process in _workers:
+            process.start()
+        logging.info(f"Started {count} job worker process(es)")
+    return _workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run cheque processing workers for the job queue.")
+    parser.add_argument("--workers", type=int, default=JOBS_WORKERS, help="number of worker processes")
+    parser.add_argument("--db", default=JOBS_DB_PATH, help="job queue SQLite file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    processes = start_workers(max(args.workers, 1), args.db)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
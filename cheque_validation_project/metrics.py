@@ -0,0 +1,205 @@
+# metrics.py
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Export settings
+METRICS_PORT = os.getenv("METRICS_PORT")
+METRICS_FILE = os.getenv("METRICS_FILE")
+# Seconds between metrics file writes in long-running job workers
+METRICS_FILE_INTERVAL = float(os.getenv("METRICS_FILE_INTERVAL", "15"))
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, description, label_name):
+        self.name = name
+        self.description = description
+        self.label_name = label_name
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label, amount=1):
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    def render(self, extra_labels=()):
+        names, values = [name for name, _ in extra_labels], [value for _, value in extra_labels]
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(names + [self.label_name], values + [label])} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, description, label_name, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_name = label_name
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self, extra_labels=()):
+        names, values = [name for name, _ in extra_labels], [value for _, value in extra_labels]
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(names + [self.label_name, "le"], values + [label, bound])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(names + [self.label_name], values + [label])
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+# Pipeline metrics
+STAGE_LATENCY = Histogram("cheque_stage_seconds", "Latency of each cheque processing stage.", "stage")
+EVENTS = Counter("cheque_events_total", "Cheque pipeline events such as fallbacks and failures.", "event")
+
+
+class Trace:
+    """Spans recorded for one cheque; re-enter it to attribute later work to the same cheque."""
+
+    def __init__(self, cheque_id):
+        self.cheque_id = cheque_id
+        self.spans = []
+        self.started = time.time()
+        self._tokens = []
+
+    def __enter__(self):
+        self._tokens.append(_current_trace.set(self))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_trace.reset(self._tokens.pop())
+
+    def finish(self):
+        """Log the span breakdown and keep the trace among the recent ones."""
+        recent_traces.append(self)
+        breakdown = ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in self.spans)
+        logging.debug(f"Trace {self.cheque_id}: {breakdown}")
+
+
+_current_trace = contextvars.ContextVar("cheque_trace", default=None)
+recent_traces = deque(maxlen=int(os.getenv("METRICS_RECENT_TRACES", "200")))
+
+
+@contextmanager
+def span(stage):
+    """Time a pipeline stage into the latency histogram and the active cheque trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.observe(stage, elapsed)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append((stage, elapsed))
+
+
+def increment(event, amount=1):
+    """Count a pipeline event."""
+    EVENTS.inc(event, amount)
+
+
+def render_prometheus(worker=None):
+    """Render every metric in the Prometheus text exposition format, labelled with the worker if given."""
+    extra_labels = [("worker", worker)] if worker else []
+    return "\n".join(STAGE_LATENCY.render(extra_labels) + EVENTS.render(extra_labels)) + "\n"
+
+
+def render_traces():
+    """The recent cheque traces, oldest first, as JSON."""
+    return json.dumps([{"cheque": trace.cheque_id, "started": trace.started, "spans": trace.spans}
+                       for trace in list(recent_traces)])
+
+
+def write_metrics_file(path=METRICS_FILE, worker=None):
+    """
+    Atomically write the Prometheus text to a file (e.g. for the node_exporter textfile collector)
+    :param worker: Name of a worker process; it writes to its own file ("metrics-worker-0.prom") and labels its series
+    """
+    if not path:
+        return
+    if worker:
+        root, extension = os.path.splitext(path)
+        path = f"{root}-{worker}{extension}"
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, "w") as f:
+            f.write(render_prometheus(worker))
+        os.replace(temp_path, path)
+    except OSError as e:
+        logging.warning(f"Could not write metrics to {path}: {e}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        route = self.path.split("?")[0]
+        if route == "/metrics":
+            body, content_type = render_prometheus().encode(), "text/plain; version=0.0.4"
+        elif route == "/traces":
+            body, content_type = render_traces().encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics and the recent traces (/traces) on the given port once per process; no-op without a port."""
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+            except OSError as e:
+                logging.warning(f"Metrics endpoint not started on port {port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True, name="metrics").start()
+            logging.info(f"Metrics endpoint listening on :{port}/metrics")
+    return _server
@@ -0,0 +1,357 @@
+# micr.py
+"""
+MICR E-13B band decoder.
+
+The MICR line sits at a fixed place on the normalized 800x400 cheque (the "micr" zone of zone_ocr).
+The band is binarized and split into glyphs by column projection, and every glyph is classified
+at once by normalized cross-correlation of its ink against the E-13B templates. Indian cheques (CTS-2010) carry
+four fields: a 6-digit cheque number, the 9-digit MICR code (city, bank, branch), a 6-digit short
+account number and a 2-digit transaction code.
+
+The built-in templates are hand-drawn approximations of the E-13B shapes on a 7x9 grid, not the
+real glyphs, so the decoder is off unless MICR_TEMPLATES_PATH points at an image of the 14 glyphs
+"0123456789" and the transit, amount, on-us and dash symbols, left to right, cut from scanned cheques.
+MICR_ENABLED=1 runs it with the built-in templates anyway, but those readings never change the extracted
+fields; they are only compared with OCR (see apply_micr).
+"""
+import os
+import threading
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from zone_ocr import load_zones
+from metrics import span, increment
+
+# Decoder settings; on by default only with templates cut from real scans
+MICR_TEMPLATES_PATH = os.getenv("MICR_TEMPLATES_PATH")
+MICR_ENABLED = os.getenv("MICR_ENABLED", "1" if MICR_TEMPLATES_PATH else "0") == "1"
+# Only readings made with templates from real scans may change extracted fields
+MICR_TRUSTED = MICR_TEMPLATES_PATH is not None
+# Fields below this confidence are left to OCR and Gemini
+MICR_MIN_CONFIDENCE = float(os.getenv("MICR_MIN_CONFIDENCE", "0.6"))
+
+# Indian MICR line: (field, digits), in band order
+MICR_LAYOUT = (("chequeNumber", 6), ("micrCode", 9), ("shortAccountNumber", 6), ("transactionCode", 2))
+
+# Characters in template order; MICR fonts conventionally map the symbols to A-D
+MICR_CHARACTERS = "0123456789ABCD"
+MICR_SYMBOLS = {"A": "transit", "B": "amount", "C": "on-us", "D": "dash"}
+
+# Approximate E-13B glyphs on the 7x9 design grid, drawn by hand
+E13B_GLYPHS = {
+    "0": (".#####.", ".#...#.", ".#...#.", ".#...#.", "##...##", "##...##", "##...##", "##...##", "#######"),
+    "1": ("###....", "..#....", "..#....", "..#....", "..#....", ".####..", ".####..", ".####..", ".####.."),
+    "2": ("######.", ".....#.", ".....#.", ".....#.", "######.", "##.....", "##.....", "##.....", "#######"),
+    "3": ("#####..", "....#..", "....#..", "....#..", "######.", "....###", "....###", "....###", "#######"),
+    "4": ("##.....", ".#.....", ".#.....", ".#..##.", ".#..##.", "#######", "....##.", "....##.", "....##."),
+    "5": ("######.", "#......", "#......", "######.", ".....##", ".....##", ".....##", ".....##", "######."),
+    "6": ("####...", "#......", "#......", "#......", "#######", "##...##", "##...##", "##...##", "#######"),
+    "7": ("######.", ".....#.", ".....#.", ".....#.", "....##.", "...###.", "...###.", "...###.", "...###."),
+    "8": ("..###..", "..#.#..", "..#.#..", ".#####.", "##...##", "##...##", "##...##", "##...##", "#######"),
+    "9": ("#######", "#.....#", "#.....#", "#.....#", "#######", ".....##", ".....##", ".....##", ".....##"),
+    "A": (".......", "....###", "....###", "###....", "###....", "###....", "###....", "....###", "....###"),
+    "B": ("##.....", "##.....", "...##..", "...##..", "...##..", "...##..", "...##..", ".....##", ".....##"),
+    "C": (".....##", ".....##", ".......", "##.##..", "##.##..", "##.##..", "##.##..", "##.##..", "##.##.."),
+    "D": (".......", ".......", ".......", "##.....", "##.##..", "...##..", ".....##", ".....##", "......."),
+}
+E13B_GRID_HEIGHT = 9
+# Character pitch in grid units (0.125 inch at 0.013 inch per unit)
+E13B_PITCH = 9.6
+
+# Glyphs are compared at this size, height x width
+TEMPLATE_SHAPE = (27, 24)
+# Glyph pieces narrower than this (in line heights) are parts of a symbol, merged across small gaps
+FRAGMENT_WIDTH = 0.4
+FRAGMENT_GAP = 0.25
+# A gap wider than this (in line heights) separates fields even without a symbol
+FIELD_GAP = 0.7
+# Confidence falls off when the runner-up template scores within this margin of the best
+CONFIDENCE_MARGIN = 0.15
+
+MICRReading = namedtuple("MICRReading", ["data", "confidence", "field_confidence", "line"])
+
+
+def render_micr_line(text, height):
+    """
+    Draw a MICR line with the built-in glyphs, black on white; used to make test cheques
+    :param text: Digits, spaces and the symbols A (transit), B (amount), C (on-us), D (dash)
+    :param height: Character height in pixels
+    """
+    unit = height / E13B_GRID_HEIGHT
+    pitch = int(round(E13B_PITCH * unit))
+    line = np.full((height, pitch * len(text)), 255, dtype=np.uint8)
+    for i, char in enumerate(text):
+        if char == " ":
+            continue
+        glyph = _glyph_bitmap(char)
+        glyph = cv2.resize(glyph, (int(round(glyph.shape[1] * unit)), height), interpolation=cv2.INTER_NEAREST)
+        line[:, i * pitch:i * pitch + glyph.shape[1]] = 255 - glyph
+    return line
+
+
+def _glyph_bitmap(char):
+    """Built-in glyph as a uint8 ink mask (255 = ink)."""
+    return np.array([[255 if cell == "#" else 0 for cell in row] for row in E13B_GLYPHS[char]], dtype=np.uint8)
+
+
+def _binarize(gray):
+    """Ink mask (255 = ink) of a grayscale band, or None if it holds no printing."""
+    gray = cv2.GaussianBlur(gray, (3, 3), 0)
+    low, high = np.percentile(gray, [1, 99])
+    if high - low < 40:
+        return None
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    return mask
+
+
+def _ink(gray):
+    """Ink darkness of a grayscale band, stretched from the paper (0) to the darkest print (255)."""
+    low, high = np.percentile(gray, [1, 50])
+    return np.clip((high - gray.astype(np.float32)) * (255 / max(high - low, 1)), 0, 255)
+
+
+def _runs(profile):
+    """(start, end) of the runs of non-zero entries in a 1-D profile."""
+    edges = np.diff(np.concatenate(([0], (profile > 0).astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+def _find_line(mask):
+    """(top, bottom) rows of the printed line: the row run holding the most ink."""
+    rows = mask.sum(axis=1) / 255
+    runs = _runs(rows >= max(2, mask.shape[1] * 0.01))
+    if not runs:
+        return None
+    return max(runs, key=lambda run: rows[run[0]:run[1]].sum())
+
+
+def _segment(mask, height):
+    """(left, right) columns of each glyph, merging symbol pieces split by small gaps."""
+    glyphs = [list(run) for run in _runs(mask.sum(axis=0))]
+    merged = True
+    while merged and len(glyphs) > 1:
+        merged = False
+        for i, (left, right) in enumerate(glyphs):
+            if right - left >= FRAGMENT_WIDTH * height:
+                continue
+            # Join the nearer neighbour when it is close enough and the result is still glyph-sized
+            gaps = [(left - glyphs[i - 1][1], i - 1) if i > 0 else None,
+                    (glyphs[i + 1][0] - right, i + 1) if i + 1 < len(glyphs) else None]
+            gap, j = min(candidate for candidate in gaps if candidate is not None)
+            start, end = min(left, glyphs[j][0]), max(right, glyphs[j][1])
+            if gap <= FRAGMENT_GAP * height and end - start <= height:
+                glyphs[min(i, j)] = [start, end]
+                del glyphs[max(i, j)]
+                merged = True
+                break
+    # Specks of noise are far narrower than any glyph
+    return [(left, right) for left, right in glyphs if right - left >= 0.15 * height]
+
+
+def _normalize(glyph):
+    """Scale a glyph (0-255 ink) to the template height keeping its aspect, centred on a fixed-width canvas."""
+    height, width = TEMPLATE_SHAPE
+    scaled_width = min(width, max(1, int(round(glyph.shape[1] * height / glyph.shape[0]))))
+    scaled = cv2.resize(glyph.astype(np.float32) / 255, (scaled_width, height), interpolation=cv2.INTER_AREA)
+    canvas = np.zeros(TEMPLATE_SHAPE, dtype=np.float32)
+    offset = (width - scaled_width) // 2
+    canvas[:, offset:offset + scaled_width] = scaled
+    return canvas
+
+
+def _unit_rows(vectors):
+    """Zero-mean, unit-length rows, so a dot product is the normalized cross-correlation."""
+    vectors = vectors - vectors.mean(axis=1, keepdims=True)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-6)
+
+
+def _template_glyphs(path=None):
+    """Normalized glyph for each of MICR_CHARACTERS, from a template image or the built-in bitmaps."""
+    if path is None:
+        glyphs = []
+        for char in MICR_CHARACTERS:
+            bitmap = _glyph_bitmap(char)
+            columns = np.flatnonzero(bitmap.any(axis=0))
+            glyphs.append(_normalize(bitmap[:, columns[0]:columns[-1] + 1]))
+        return glyphs
+
+    gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise ValueError(f"Could not read MICR templates: {path}")
+    mask = _binarize(gray)
+    line = _find_line(mask) if mask is not None else None
+    if line is None:
+        raise ValueError(f"No glyphs found in MICR templates: {path}")
+    mask = mask[line[0]:line[1]]
+    columns = _segment(mask, line[1] - line[0])
+    if len(columns) != len(MICR_CHARACTERS):
+        raise ValueError(f"Expected {len(MICR_CHARACTERS)} glyphs in {path}, found {len(columns)}")
+    return [_normalize(mask[:, left:right]) for left, right in columns]
+
+
+def _shifted(glyph):
+    """The glyph moved by up to one pixel in each direction, so small misalignments still match."""
+    return [np.roll(np.roll(glyph, dy, axis=0), dx, axis=1) for dy in (-1, 0, 1) for dx in (-1, 0, 1)]
+
+
+_templates = None
+_templates_lock = threading.Lock()
+
+
+def get_templates():
+    """Return the (characters x shifts, pixels) template matrix, built on first use."""
+    global _templates
+    if _templates is None:
+        with _templates_lock:
+            if _templates is None:
+                variants = [_shifted(glyph) for glyph in _template_glyphs(MICR_TEMPLATES_PATH)]
+                _templates = _unit_rows(np.array(variants, dtype=np.float32).reshape(
+                    len(MICR_CHARACTERS) * len(variants[0]), -1))
+    return _templates
+
+
+def classify(glyphs):
+    """
+    Classify normalized glyphs against every template in one matrix product
+    :param glyphs: (n, height, width) array of normalized glyphs
+    :return: (characters, confidences) - a string of MICR_CHARACTERS and an (n,) float array
+    """
+    templates = get_templates()
+    scores = _unit_rows(glyphs.reshape(len(glyphs), -1)) @ templates.T
+    # Best shift of each template, then the best template
+    scores = scores.reshape(len(glyphs), len(MICR_CHARACTERS), -1).max(axis=2)
+    ranked = np.sort(scores, axis=1)
+    best, runner_up = ranked[:, -1], ranked[:, -2]
+    confidence = np.clip(best, 0, 1) * np.minimum(1, (best - runner_up) / CONFIDENCE_MARGIN)
+    characters = "".join(MICR_CHARACTERS[i] for i in scores.argmax(axis=1))
+    return characters, confidence
+
+
+def _split_fields(characters, confidences, columns, height):
+    """Group digits into fields at symbols and wide gaps: [(digits, confidences, closing symbol or None), ...]."""
+    fields, digits, scores = [], "", []
+    previous_right = None
+    for char, confidence, (left, right) in zip(characters, confidences, columns):
+        gap = previous_right is not None and left - previous_right > FIELD_GAP * height
+        if (char in MICR_SYMBOLS or gap) and digits:
+            fields.append((digits, scores, char if char in MICR_SYMBOLS else None))
+            digits, scores = "", []
+        if char not in MICR_SYMBOLS:
+            digits += char
+            scores.append(confidence)
+        previous_right = right
+    if digits:
+        fields.append((digits, scores, None))
+    return fields
+
+
+def _layout_fields(fields):
+    """
+    Match decoded fields to MICR_LAYOUT: {name: (digits, confidences)} for the fields of the right length
+    The transit symbol closes the MICR code, so the other fields are placed around it; without one,
+    each field takes the next slot of its length. A field of the wrong length never shifts the others.
+    """
+    names = [name for name, _ in MICR_LAYOUT]
+    lengths = dict(MICR_LAYOUT)
+    slots = {}
+    transit = next((i for i, field in enumerate(fields) if MICR_SYMBOLS.get(field[2]) == "transit"), None)
+    if transit is not None:
+        for offset, name in enumerate(names, start=transit - names.index("micrCode")):
+            if 0 <= offset < len(fields):
+                slots[name] = fields[offset]
+    else:
+        position = 0
+        for field in fields:
+            slot = next((i for i in range(position, len(names)) if len(field[0]) == lengths[names[i]]), None)
+            if slot is not None:
+                slots[names[slot]] = field
+                position = slot + 1
+    return {name: field[:2] for name, field in slots.items() if len(field[0]) == lengths[name]}
+
+
+def read_micr(image, box=None, min_confidence=MICR_MIN_CONFIDENCE):
+    """
+    Decode the MICR band of a normalized cheque
+    :param image: Cropped 800x400 BGR or grayscale cheque
+    :param box: (left, top, right, bottom) band fractions; defaults to the "micr" zone
+    :param min_confidence: Fields below this confidence are left out of the line text
+    :return: MICRReading, or None if no printed line was found. data maps each MICR_LAYOUT field to its
+             digits ("" when missing); confidence is the lowest field confidence; line holds the confident
+             fields in band order
+    """
+    with span("micr_decode"):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        height, width = gray.shape
+        left, top, right, bottom = box or load_zones()["micr"]["box"]
+        band = gray[int(top * height):int(bottom * height), int(left * width):int(right * width)]
+        mask = _binarize(band)
+        line = _find_line(mask) if mask is not None else None
+        if line is None or line[1] - line[0] < 6:
+            increment("micr_not_found")
+            return None
+
+        line_height = line[1] - line[0]
+        columns = _segment(mask[line[0]:line[1]], line_height)
+        if not columns:
+            increment("micr_not_found")
+            return None
+        # Glyphs are matched on ink darkness rather than the mask, which blur erodes unevenly
+        ink = _ink(band)[line[0]:line[1]]
+        glyphs = np.array([_normalize(ink[:, left:right]) for left, right in columns])
+        characters, confidences = classify(glyphs)
+        fields = _layout_fields(_split_fields(characters, confidences, columns, line_height))
+
+        # Missing fields, and ones with the wrong digit count, are left empty
+        data, field_confidence = {}, {}
+        for name, _ in MICR_LAYOUT:
+            digits, scores = fields.get(name, ("", [0.0]))
+            data[name], field_confidence[name] = digits, float(min(scores))
+        line_text = " ".join(data[name] for name, _ in MICR_LAYOUT if field_confidence[name] >= min_confidence)
+    increment("micr_decoded")
+    return MICRReading(data, min(field_confidence.values()), field_confidence, line_text)
+
+
+# OCR slips that turn a digit into a look-alike letter
+DIGIT_LOOKALIKES = str.maketrans("OoDQIl|!SsBZzG", "00001111558226")
+
+
+def same_number(extracted, micr_digits):
+    """Whether an extracted number reads as the MICR digits, allowing look-alike letters and dropped leading zeros."""
+    digits = "".join(char for char in (extracted or "").translate(DIGIT_LOOKALIKES) if char.isdigit())
+    return bool(digits) and len(digits) <= len(micr_digits) and digits.zfill(len(micr_digits)) == micr_digits
+
+
+def apply_micr(cheque_data, reading, min_confidence=MICR_MIN_CONFIDENCE, trusted=MICR_TRUSTED):
+    """
+    Check the identifier fields against a MICR reading
+    A confident cheque number fills in a missing one, and only replaces the extracted one when both read the
+    same number, putting it in its printed form (e.g. restoring leading zeros); one that disagrees is left
+    alone and counted. The MICR code is taken as read. Untrusted readings (built-in templates) are only counted.
+    :param cheque_data: Extracted cheque dict, updated in place
+    :param reading: MICRReading from read_micr
+    :param trusted: Whether the reading may change cheque_data
+    """
+    cheque_number = reading.data["chequeNumber"]
+    extracted = cheque_data.get("chequeNumber") or ""
+    if reading.field_confidence["chequeNumber"] >= min_confidence:
+        if not extracted:
+            if trusted:
+                increment("micr_cheque_number_fills")
+                cheque_data["chequeNumber"] = cheque_number
+        elif same_number(extracted, cheque_number):
+            increment("micr_cheque_number_agreements")
+            if trusted:
+                cheque_data["chequeNumber"] = cheque_number
+        else:
+            increment("micr_cheque_number_mismatches")
+    if trusted and reading.field_confidence["micrCode"] >= min_confidence:
+        cheque_data["micrCode"] = reading.data["micrCode"]
+    # The band only carries the account's last six digits; a mismatch points at a misread account number
+    short_account = reading.data["shortAccountNumber"]
+    account = cheque_data.get("accountNumber") or ""
+    confident = reading.field_confidence["shortAccountNumber"] >= min_confidence
+    if confident and account and not account.endswith(short_account):
+        increment("micr_account_mismatches")
+    return cheque_data
@@ -0,0 +1,160 @@
+# ocr_engine.py
+import os
+import time
+import shlex
+import queue
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from metrics import STAGE_LATENCY
+
+# OCR engine settings ("tesserocr" falls back to "pytesseract" when the bindings are unavailable)
+OCR_ENGINE = os.getenv("OCR_ENGINE", "tesserocr")
+OCR_POOL_SIZE = int(os.getenv("OCR_POOL_SIZE", str(os.cpu_count() or 1)))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+OCR_TESSDATA_PATH = os.getenv("OCR_TESSDATA_PATH") or os.getenv("TESSDATA_PREFIX")
+
+# Default Tesseract page-segmentation mode (fully automatic, no OSD)
+PSM_AUTO = 3
+
+OCRResult = namedtuple("OCRResult", ["text", "latency"])
+OCRRequest = namedtuple("OCRRequest", ["image", "psm", "whitelist"])
+
+
+class OCREngine:
+    """Base class for OCR engines; subclasses implement _recognize."""
+
+    def __init__(self):
+        self.stats = {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+        self._stats_lock = threading.Lock()
+        # Threads for recognize_many, one per concurrent recognition; started on first use
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _recognize(self, image, psm, whitelist):
+        raise NotImplementedError
+
+    def recognize(self, image, psm=PSM_AUTO, whitelist=None):
+        """OCR an in-memory image (ndarray or PIL) and return OCRResult(text, latency)."""
+        start = time.perf_counter()
+        text = self._recognize(image, psm, whitelist)
+        latency = time.perf_counter() - start
+        STAGE_LATENCY.observe("tesseract", latency)
+        with self._stats_lock:
+            self.stats["calls"] += 1
+            self.stats["total_seconds"] += latency
+            self.stats["max_seconds"] = max(self.stats["max_seconds"], latency)
+        return OCRResult(text, latency)
+
+    def recognize_many(self, requests):
+        """OCR a batch of images or OCRRequest tuples concurrently on the engine's threads, preserving order."""
+        requests = [r if isinstance(r, OCRRequest) else OCRRequest(r, PSM_AUTO, None) for r in requests]
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ocr")
+        return list(self._executor.map(lambda r: self.recognize(r.image, r.psm, r.whitelist), requests))
+
+    @property
+    def concurrency(self):
+        return OCR_POOL_SIZE
+
+    def mean_latency(self):
+        """Average seconds per recognize call so far."""
+        return self.stats["total_seconds"] / self.stats["calls"] if self.stats["calls"] else 0.0
+
+    def close(self):
+        """Stop the recognize_many threads."""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+class PytesseractEngine(OCREngine):
+    """Runs the tesseract binary once per call via pytesseract."""
+
+    def _recognize(self, image, psm, whitelist):
+        import pytesseract
+
+        config = f"--psm {psm}"
+        if whitelist:
+            config += " -c " + shlex.quote(f"tessedit_char_whitelist={whitelist}")
+        return pytesseract.image_to_string(np.asarray(image), lang=OCR_LANG, config=config)
+
+
+class TesserocrPoolEngine(OCREngine):
+    def __init__(self, size=OCR_POOL_SIZE, lang=OCR_LANG, path=OCR_TESSDATA_PATH):
+        """
+        Pool of long-lived Tesseract API handles that load the language data once
+        :param size: Number of handles, i.e. concurrent recognitions
+        :param lang: Tesseract language
+        :param path: tessdata directory (None uses the library default)
+        """
+        super().__init__()
+        # tesserocr installs signal handlers on import, which only the main thread may do;
+        # the job and batch workers create their engine at start-up (see load_ocr_engine)
+        import tesserocr
+
+        self.size = size
+        self._apis = queue.Queue()
+        for _ in range(size):
+            kwargs = {"lang": lang}
+            if path:
+                kwargs["path"] = path
+            self._apis.put(tesserocr.PyTessBaseAPI(**kwargs))
+
+    @property
+    def concurrency(self):
+        return self.size
+
+    def _recognize(self, image, psm, whitelist):
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+        api = self._apis.get()
+        try:
+            api.SetPageSegMode(psm)
+            api.SetVariable("tessedit_char_whitelist", whitelist or "")
+            api.SetImage(image)
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+            self._apis.put(api)
+
+    def close(self):
+        """Stop the recognize_many threads, then release every Tesseract handle in the pool."""
+        super().close()
+        while not self._apis.empty():
+            self._apis.get().End()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_ocr_engine():
+    """Return the process-wide OCR engine, preferring the tesserocr pool."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                if OCR_ENGINE == "tesserocr":
+                    try:
+                        _engine = TesserocrPoolEngine()
+                    except Exception as e:
+                        logging.warning(f"Tesseract worker pool unavailable, using pytesseract: {e}")
+                if _engine is None:
+                    _engine = PytesseractEngine()
+    return _engine
+
+
+def load_ocr_engine():
+    """Create the OCR engine on the calling (main) thread at process start-up, so tesserocr can be imported."""
+    if threading.current_thread() is not threading.main_thread():
+        logging.warning("OCR engine loaded off the main thread; tesserocr may be unavailable")
+    return get_ocr_engine()
@@ -1,55 +1,43 @@
 import streamlit as st
-from pymongo import MongoClient
 import pandas as pd
-import json
+from exports import EXPORT_FORMATS, EXPORT_APP_MAX_ROWS, export_cheques, export_command
+from app_cache import get_page_store, data_version, cached_banks, cached_count, cached_page
 
 # Page title
 st.title("📊 Dashboard")
 
-# Connect to MongoDB
-def get_db_connection():
-    client = MongoClient(st.secrets["MONGO_URI"])  # Access MongoDB URI from secrets.toml
-    db = client["cheque_processing_db"]
-    return db["cheque_details"]
-
-# Fetch data from MongoDB
-def fetch_cheque_data():
-    collection = get_db_connection()
-    data = list(collection.find({}, {"_id": 0}))  # Exclude the _id field
-    return pd.DataFrame(data)
-
 # Display data
 st.header("Processed Cheque Data")
-data = fetch_cheque_data()
+store = get_page_store()
+
+# Query results are cached until cheques are inserted (or the cache TTL passes)
+version = data_version()
+
+# Add filters and search in the sidebar
+st.sidebar.header("Filters")
 
-if not data.empty:
-    # Add filters and search in the sidebar
-    st.sidebar.header("Filters")
+# Filter by Bank
+bank_filter = st.sidebar.selectbox("Filter by Bank", ["All"] + cached_banks(version))
 
-    # Filter by Bank
-    bank_filter = st.sidebar.selectbox("Filter by Bank", ["All"] + list(data["bank"].unique()))
+# Search by Cheque Number, Account Number, or Payee
+search_query = st.sidebar.text_input("Search by Cheque Number, Account Number, or Payee")
 
-    # Search by Cheque Number, Account Number, or Payee
-    search_query = st.sidebar.text_input("Search by Cheque Number, Account Number, or Payee")
+# Filters are applied by the cheque store; only the visible page is loaded
+filters_active = bank_filter != "All" or bool(search_query.strip())
+total_records = cached_count(bank_filter, search_query, version)
 
-    # Apply filters
-    if bank_filter != "All":
-        data = data[data["bank"] == bank_filter]
+if total_records:
+    page_size = st.sidebar.selectbox("Rows per page", [25, 50, 100, 250], index=1)
+    page_count = (total_records + page_size - 1) // page_size
+    page_number = st.sidebar.number_input("Page", min_value=1, max_value=page_count, value=1, step=1)
 
-    if search_query:
-        # Filter data based on search query
-        data = data[
-            data["chequeNumber"].astype(str).str.contains(search_query, case=False) |
-            data["accountNumber"].astype(str).str.contains(search_query, case=False) |
-            data["payee"].astype(str).str.contains(search_query, case=False)
-        ]
+    data = pd.DataFrame(cached_page(bank_filter, search_query, page_number, page_size, version))
 
-    # Reset index to start from 1 instead of 0
-    data.reset_index(drop=True, inplace=True)
-    data.index = data.index + 1
+    # Number rows from 1 across pages
+    data.index = data.index + 1 + (page_number - 1) * page_size
 
     # Display filtered data
-    st.write(f"Showing {len(data)} records:")
+    st.write(f"Showing {len(data)} of {total_records} records (page {page_number} of {page_count}):")
 
     # Make the table extendible in all directions
     st.dataframe(
@@ -59,25 +47,32 @@ if not data.empty:
         use_container_width=True,  # Make the table responsive to the container width
     )
 
-    # Add download buttons for filtered data
+    # Exports cover every matching cheque and are only built for the click that downloads them,
+    # streamed from the cheque store in batches rather than from the table above
+    st.subheader("Export")
     col1, col2 = st.columns(2)
-
-    # Download as CSV
-    csv = data.to_csv(index=False).encode("utf-8")
-    col1.download_button(
-        label="Download Filtered Data as CSV",
-        data=csv,
-        file_name="filtered_cheque_data.csv",
-        mime="text/csv",
-    )
-
-    # Download as JSON
-    json_data = data.to_json(orient="records", indent=4)
-    col2.download_button(
-        label="Download Filtered Data as JSON",
-        data=json_data,
-        file_name="filtered_cheque_data.json",
-        mime="application/json",
+    export_format = col1.selectbox(
+        "Format", list(EXPORT_FORMATS), format_func=lambda key: EXPORT_FORMATS[key].label
     )
+    if total_records > EXPORT_APP_MAX_ROWS:
+        # Too large to build inside the app; the export script streams it straight to a file
+        st.info(f"Exports of more than {EXPORT_APP_MAX_ROWS} records are not built in the app. "
+                "Run this from the project folder instead:")
+        st.code(export_command(bank_filter, search_query, export_format), language="bash")
+    elif col2.button(f"Prepare Export of {total_records} Record(s)"):
+        with st.spinner("Exporting cheques..."):
+            with export_cheques(store, bank_filter, search_query, export_format) as export_file:
+                export_data = export_file.read()
+        # Kept only for this run; downloading does not rerun the page
+        selected = EXPORT_FORMATS[export_format]
+        st.download_button(
+            label=f"Download {selected.label}",
+            data=export_data,
+            file_name=f"filtered_cheque_data{selected.extension}",
+            mime=selected.mime,
+            on_click="ignore",
+        )
+elif filters_active:
+    st.warning("No cheques match the current filters.")
 else:
-    st.warning("No cheque data found in the database.")
\ No newline at end of file
+    st.warning("No cheque data found in the database.")
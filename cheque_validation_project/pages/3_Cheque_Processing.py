@@ -1,61 +1,116 @@
 # pages/3_🧾_Cheque_Processing.py
 import os
-from tempfile import NamedTemporaryFile
-from pdf2image import convert_from_path
-import streamlit as st
-from utils import process_and_crop_cheque, preprocess_image, refine_text_with_gemini, insert_cheque_details, get_db_connection, process_pdf
-import pytesseract
-from PIL import Image
 import json
-from datetime import datetime
+import streamlit as st
+from jobs import start_workers, QUEUED, RUNNING, DONE, FAILED, JOBS_POLL_INTERVAL
+from pipeline import PAGE_EXTRACTED, PAGE_SAVED, PAGE_DUPLICATE, PAGE_NO_TEXT, PAGE_REJECTED
+from metrics import start_metrics_server
+from app_cache import get_job_queue, invalidate_cheque_caches
+from utils import configure_logging
+
+# Log to the console and app.log, and expose pipeline metrics when METRICS_PORT is set (once per process)
+configure_logging()
+start_metrics_server()
+
+# Uploads from every session share one queue and one pool of worker processes
+start_workers()
+queue = get_job_queue()
 
 # Page title
 st.title("🧾 Cheque Processing")
 
 # File uploader
 uploaded_file = st.file_uploader(
-    "Upload Bank Cheque PDF or Image", 
+    "Upload Bank Cheque PDF or Image",
     type=["pdf", "png", "jpg", "jpeg"]
 )
 
-if uploaded_file:
-    os.makedirs("output_images", exist_ok=True)
-
-    if uploaded_file.type == "application/pdf":
-        with NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            temp_file.write(uploaded_file.read())
-            processed_images = process_pdf(temp_file.name)  # Line 27
-    else:
-        original_image = Image.open(uploaded_file).convert("RGB")
-        processed_images = [process_and_crop_cheque(original_image)]
-
-    for i, processed_image in enumerate(processed_images):
-        col1, col2 = st.columns(2)
-        with col1:
-            st.image(processed_image, caption=f"Processed Cheque Page {i + 1}", use_container_width=True)
-
-        processed_image = preprocess_image(processed_image)
-        extracted_text = pytesseract.image_to_string(processed_image)
-
-        if extracted_text.strip():
-            cheque_data = refine_text_with_gemini(extracted_text)
-            
-            if cheque_data:
-                cheque_data["timestamp"] = datetime.now().isoformat()
-                
-                st.subheader(f"🌟 Extracted Cheque Details for Page {i + 1}:")
-                st.code(json.dumps(cheque_data, indent=2), language="json")
-                
-                db, connection_status = get_db_connection()
-                st.write(connection_status)
-                
-                if db is not None:
-                    inserted_id = insert_cheque_details(db, cheque_data)
-                    if inserted_id:
-                        st.success(f"✅ Cheque details saved to database with ID: {inserted_id}")
-                    else:
-                        st.error("❌ Failed to insert cheque details into the database.")
-                else:
-                    st.error("❌ Failed to connect to MongoDB. Please check your connection settings.")
+# Enqueue each upload once; reruns only poll the job
+jobs = st.session_state.setdefault("cheque_jobs", {})
+if uploaded_file and uploaded_file.file_id not in jobs:
+    jobs[uploaded_file.file_id] = queue.enqueue(uploaded_file.name, uploaded_file.type, uploaded_file.getvalue())
+
+
+def render_page(page):
+    """Show one page's preview, progress and extracted details."""
+    number = page["page"]
+    col1, col2 = st.columns(2)
+    with col1:
+        if page["image_path"] and os.path.exists(page["image_path"]):
+            st.image(page["image_path"], caption=f"Processed Cheque Page {number}", use_container_width=True)
+    with col2:
+        if page["note"]:
+            st.caption(page["note"])
+        if page["status"] == RUNNING:
+            st.caption("⏳ Extracting details...")
+        elif page["status"] in (PAGE_EXTRACTED, PAGE_SAVED):
+            st.subheader(f"🌟 Extracted Cheque Details for Page {number}:")
+            st.code(json.dumps(page["data"], indent=2), language="json")
+        elif page["status"] == PAGE_DUPLICATE:
+            st.subheader(f"♻️ Cheque on Page {number} is already saved:")
+            st.code(json.dumps(page["data"], indent=2), language="json")
+        elif page["status"] == PAGE_NO_TEXT:
+            st.error(f"❌ No text extracted from Page {number} - check image quality.")
+        elif page["status"] == PAGE_REJECTED:
+            st.warning(f"🚫 Page {number} failed the quality check and was not processed.")
         else:
-            st.error(f"❌ No text extracted from Page {i + 1} - check image quality.")
\ No newline at end of file
+            st.error(f"❌ Could not process Page {number}.")
+            if page["data"]:
+                st.code(json.dumps(page["data"], indent=2), language="json")
+
+
+def render_job(job, pages):
+    """Show a job's overall progress followed by its pages."""
+    st.subheader(f"📄 {job['filename']}")
+    if job["status"] == QUEUED:
+        st.info(f"⏳ Waiting for a worker ({queue.queue_position(job['id'])} upload(s) ahead)...")
+    elif job["status"] == RUNNING:
+        total = job["total_pages"] or 0
+        finished = sum(1 for page in pages if page["status"] not in (RUNNING, PAGE_EXTRACTED))
+        st.progress(finished / total if total else 0.0, text=f"Processed {finished} of {total or '?'} page(s)")
+    elif job["status"] == FAILED:
+        st.error(f"❌ Processing failed: {job['error']}")
+
+    for page in pages:
+        render_page(page)
+
+    if job["status"] == DONE:
+        saved = sum(1 for page in pages if page["status"] == PAGE_SAVED)
+        duplicates = sum(1 for page in pages if page["status"] == PAGE_DUPLICATE)
+        rejected = sum(1 for page in pages if page["status"] == PAGE_REJECTED)
+        failed = sum(1 for page in pages if page["status"] not in (PAGE_SAVED, PAGE_DUPLICATE, PAGE_NO_TEXT,
+                                                                   PAGE_REJECTED))
+        if saved:
+            st.success(f"✅ {saved} cheque(s) saved to database.")
+        if duplicates:
+            st.info(f"♻️ {duplicates} cheque(s) were already saved and were skipped.")
+        if rejected:
+            st.warning(f"🚫 {rejected} page(s) were skipped by the quality check.")
+        if failed:
+            st.error(f"❌ Failed to save {failed} cheque(s).")
+
+
+def show_job(job_id):
+    """Render a job, polling its status until the workers finish it."""
+    job = queue.get_job(job_id)
+    if job is None:
+        return
+    finished = job["status"] in (DONE, FAILED)
+
+    @st.fragment(run_every=None if finished else JOBS_POLL_INTERVAL)
+    def job_status():
+        current = queue.get_job(job_id)
+        render_job(current, queue.get_pages(job_id))
+        if not finished and current["status"] in (DONE, FAILED):
+            # New cheques were saved; the Dashboard and Analytics queries must not be served from cache
+            invalidate_cheque_caches()
+            # Rerun the whole page so the finished job stops polling
+            st.rerun()
+
+    job_status()
+
+
+# Newest upload first
+for job_id in reversed(list(jobs.values())):
+    with st.container(border=True):
+        show_job(job_id)
@@ -0,0 +1,269 @@
+# pipeline.py
+import logging
+from datetime import datetime
+from collections import namedtuple
+from concurrent.futures import Future
+
+from PIL import Image
+
+from utils import crop_cheque, preprocess_image, rasterize_pdf, BulkChequeWriter
+from gemini_engine import gemini_refiner
+from zone_ocr import ocr_zones, format_zone_text, load_zones
+from ocr_engine import get_ocr_engine
+from extraction import extract_with_confidence, is_confident
+from dedup import DuplicateIndex, DEDUP_ENABLED, perceptual_hash, same_image, cheque_key
+from quality import assess_page, alternate_preprocess, QUALITY_GATE_ENABLED, QUALITY_RETRY, QUALITY_REJECT
+from micr import read_micr, apply_micr, same_number, MICR_ENABLED, MICR_TRUSTED, MICR_MIN_CONFIDENCE
+from metrics import Trace, span, increment
+
+PDF_CONTENT_TYPE = "application/pdf"
+
+# Page outcomes; "extracted" pages become "saved", "duplicate" or "failed" once written
+PAGE_EXTRACTED = "extracted"
+PAGE_SAVED = "saved"
+PAGE_DUPLICATE = "duplicate"
+PAGE_NO_TEXT = "no_text"
+PAGE_REJECTED = "rejected"
+PAGE_FAILED = "failed"
+
+PageResult = namedtuple("PageResult", ["page", "status", "data", "note"])
+
+
+def count_pages(path, content_type):
+    """Number of cheque pages in an uploaded file."""
+    if content_type == PDF_CONTENT_TYPE:
+        from pdf2image import pdfinfo_from_path
+        return pdfinfo_from_path(path)["Pages"]
+    return 1
+
+
+def load_pages(path, content_type):
+    """Yield (cropped BGR cheque, border found) for each page of an uploaded PDF or image file."""
+    if content_type == PDF_CONTENT_TYPE:
+        for page in rasterize_pdf(path):
+            yield crop_cheque(page)
+    else:
+        with Image.open(path) as image:
+            yield crop_cheque(image.convert("RGB"))
+
+
+def extract_text(image, alternate=False, micr_line=None):
+    """
+    Preprocess and OCR a cropped cheque, falling back to the whole page if the field zones come back empty
+    :param alternate: Use the quality gate's alternate preprocessing (for blurry or low-contrast pages)
+    :param micr_line: Decoded MICR line; the MICR zone is then not OCR'd
+    """
+    processed = alternate_preprocess(image) if alternate else preprocess_image(image)
+    zones = load_zones()
+    if micr_line:
+        zones = {field: zone for field, zone in zones.items() if field != "micr"}
+    zone_text = ocr_zones(processed, zones)
+    if micr_line:
+        zone_text["micr"] = micr_line
+    text = format_zone_text(zone_text)
+    if not text:
+        text = get_ocr_engine().recognize(processed).text
+    return text
+
+
+def _with_micr(local, micr):
+    """Local extraction with its cheque number filled in or confirmed by a confident MICR reading."""
+    micr_confidence = micr.field_confidence["chequeNumber"]
+    extracted = local.data["chequeNumber"]
+    if micr_confidence < MICR_MIN_CONFIDENCE or (extracted and not same_number(extracted, micr.data["chequeNumber"])):
+        return local
+    data = dict(local.data, chequeNumber=micr.data["chequeNumber"])
+    field_confidence = dict(local.field_confidence,
+                            chequeNumber=max(local.field_confidence["chequeNumber"], micr_confidence))
+    return local._replace(data=data, confidence=min(field_confidence.values()), field_confidence=field_confidence)
+
+
+def refine_text(text, micr=None):
+    """
+    Return (future, note); confident local extractions complete at once and skip the Gemini round trip
+    :param micr: MICRReading of the page; with trusted templates its cheque number counts towards the confidence
+    """
+    local = extract_with_confidence(text)
+    if micr is not None and MICR_TRUSTED:
+        local = _with_micr(local, micr)
+    if is_confident(local):
+        increment("gemini_skipped_local")
+        future = Future()
+        future.set_result(local.data)
+        return future, f"⚡ Extracted locally (confidence {local.confidence:.2f})"
+    return gemini_refiner.submit(text), None
+
+
+def _without_id(cheque):
+    return {key: value for key, value in cheque.items() if key != "_id"}
+
+
+def process_document(path, content_type, name, store, on_page=None, save=True, artifacts=None):
+    """
+    Run the cheque pipeline over one uploaded document, yielding a PageResult per page update
+    OCR runs as pages are rasterized while Gemini refines uncertain pages in the background; results
+    come out in page order, and every written page is yielded again with its final status. Pages the
+    quality gate rejects are reported as "rejected" without running OCR or Gemini.
+    :param path: Uploaded PDF or image file
+    :param content_type: MIME type of the upload
+    :param name: Name used in traces
+    :param store: ChequeStore from get_cheque_store (None skips dedup and inserts)
+    :param on_page: Called as on_page(page, image_key, note) once a page is cropped
+    :param save: Insert new cheques; when False, pages end as "extracted"
+    :param artifacts: ArtifactStore for the cropped pages; new cheques link theirs as "imageKey"
+    """
+    duplicates = DuplicateIndex(store) if store is not None and DEDUP_ENABLED else None
+
+    pages = []
+    upload_hashes = []
+    images = iter(load_pages(path, content_type))
+    while True:
+        i = len(pages) + 1
+        trace = Trace(f"{name}:{i}")
+        with trace:
+            # Cropping (and PDF rasterization) happens while pulling the next page
+            page = next(images, None)
+            if page is None:
+                break
+            image, border_found = page
+
+            image_key = None
+            if artifacts is not None:
+                try:
+                    image_key = artifacts.put(image)
+                except (OSError, ValueError) as e:
+                    logging.warning(f"Could not store page {i} of {name}: {e}")
+
+            # Pages that cannot yield a cheque skip everything else; borderline ones get alternate preprocessing
+            report = assess_page(image, border_found) if QUALITY_GATE_ENABLED else None
+            if report is not None and report.action == QUALITY_REJECT:
+                logging.info(f"Rejected page {i} of {name}: {'; '.join(report.reasons)}")
+                note = f"🚫 Skipped before OCR: {'; '.join(report.reasons)}"
+                if on_page is not None:
+                    on_page(i, image_key, note)
+                pages.append((i, None, trace, None, image_key, None, None, False, True, note))
+                continue
+            retry = report is not None and report.action == QUALITY_RETRY
+
+            # Re-uploaded cheques and repeated pages (identical image hashes) skip OCR, Gemini and the insert;
+            # a near-identical stored image is only a candidate until the extracted cheque key matches it
+            image_hash = perceptual_hash(image)
+            candidate = duplicates.find_image(image_hash) if duplicates is not None else None
+            repeat = next((j for seen, j in upload_hashes if same_image(seen, image_hash)), None)
+            future, note, micr, duplicate = None, None, None, False
+            if candidate is not None and candidate[1] == 0:
+                future, duplicate = Future(), True
+                future.set_result(_without_id(candidate[0]))
+                note = "♻️ Already processed (identical image) - showing the stored record"
+            elif repeat is not None:
+                future, duplicate = pages[repeat - 1][1], True
+                note = f"♻️ Same cheque as page {repeat}"
+            else:
+                upload_hashes.append((image_hash, i))
+                # The MICR band is only where expected on a cheque whose border was found
+                micr = read_micr(image) if MICR_ENABLED and border_found else None
+                # The MICR zone is only left out of OCR when every field of the band was read confidently
+                # with trusted templates
+                complete = micr is not None and MICR_TRUSTED and micr.confidence >= MICR_MIN_CONFIDENCE
+                text = extract_text(image, alternate=retry, micr_line=micr.line if complete else None)
+                if text.strip():
+                    future, note = refine_text(text, micr)
+                if retry:
+                    retry_note = f"🔁 Retried with alternate preprocessing: {'; '.join(report.reasons)}"
+                    note = f"{retry_note} · {note}" if note else retry_note
+
+            if on_page is not None:
+                on_page(i, image_key, note)
+        pages.append((i, future, trace, image_hash, image_key, micr, candidate, duplicate, False, note))
+
+    # Send the last pages' Gemini requests without waiting for their batch to fill
+    gemini_refiner.flush()
+
+    # Collect refined results in page order and save them in bulk
+    writer = BulkChequeWriter(store) if store is not None and save else None
+    new_cheques = []
+    # Cheque keys extracted from earlier pages of this upload, so a cheque scanned twice is kept once
+    upload_keys = {}
+
+    for i, future, trace, image_hash, image_key, micr, candidate, duplicate, rejected, note in pages:
+        with trace:
+            if rejected:
+                yield PageResult(i, PAGE_REJECTED, None, note)
+                trace.finish()
+                continue
+            if future is None:
+                increment("no_text_pages")
+                yield PageResult(i, PAGE_NO_TEXT, None, "❌ No text extracted - check image quality.")
+                trace.finish()
+                continue
+
+            try:
+                with span("gemini_wait"):
+                    cheque_data = future.result()
+            except Exception as e:
+                logging.error(f"Refinement failed for {name} page {i}: {e}")
+                cheque_data = None
+            if not cheque_data:
+                yield PageResult(i, PAGE_FAILED, None, "❌ Could not extract cheque details.")
+                trace.finish()
+                continue
+            if micr is not None:
+                # MICR digits confirm the identifier fields (and only change them when they agree)
+                cheque_data = apply_micr(dict(cheque_data), micr)
+
+            stored = None
+            if not duplicate and duplicates is not None:
+                stored = duplicates.confirm_image(candidate, cheque_data)
+                if stored is not None:
+                    note = (f"♻️ Already processed ({candidate[1]:.0%} image difference,"
+                            f" same cheque number and account)")
+                else:
+                    stored = duplicates.find_cheque(cheque_data)
+                if stored is not None:
+                    duplicates.record(image_hash, stored["_id"])
+
+            key = cheque_key(cheque_data)
+            key = tuple(key.values()) if key is not None else None
+            earlier = upload_keys.get(key) if not duplicate and stored is None else None
+
+            if duplicate or stored is not None:
+                yield PageResult(i, PAGE_DUPLICATE, _without_id(stored or cheque_data),
+                                 note or "♻️ Same cheque number and account as a stored cheque")
+            elif earlier is not None:
+                yield PageResult(i, PAGE_DUPLICATE, dict(cheque_data),
+                                 f"♻️ Same cheque number and account as page {earlier}")
+            else:
+                if key is not None:
+                    upload_keys[key] = i
+                cheque_data["timestamp"] = datetime.now().isoformat()
+                if image_key is not None:
+                    cheque_data["imageKey"] = image_key
+                if writer is not None:
+                    writer.add(cheque_data)
+                    new_cheques.append((i, image_hash, cheque_data, note))
+                    yield PageResult(i, PAGE_EXTRACTED, dict(cheque_data), note)
+                elif not save:
+                    yield PageResult(i, PAGE_EXTRACTED, dict(cheque_data), note)
+                else:
+                    yield PageResult(i, PAGE_FAILED, dict(cheque_data), "❌ Failed to connect to the database.")
+        trace.finish()
+
+    if writer is None:
+        return
+    writer.flush()
+
+    # Report the final status of every written page and fingerprint the stored ones
+    inserted = set(writer.inserted_ids)
+    if artifacts is not None:
+        # Saved cheques link their images, so those are kept out of eviction
+        artifacts.pin([cheque_data["imageKey"] for _, _, cheque_data, _ in new_cheques
+                       if cheque_data.get("_id") in inserted and "imageKey" in cheque_data])
+    for i, image_hash, cheque_data, note in new_cheques:
+        if cheque_data.get("_id") in inserted:
+            if duplicates is not None:
+                duplicates.record(image_hash, cheque_data["_id"])
+            yield PageResult(i, PAGE_SAVED, _without_id(cheque_data), note)
+        elif duplicates is not None and duplicates.find_cheque(cheque_data) is not None:
+            yield PageResult(i, PAGE_DUPLICATE, _without_id(cheque_data), "♻️ Already saved by another upload")
+        else:
+            yield PageResult(i, PAGE_FAILED, _without_id(cheque_data), "❌ Failed to insert into the database.")
@@ -0,0 +1,95 @@
+# queries.py
+import re
+import logging
+
+from pymongo import ASCENDING, DESCENDING, TEXT
+
+# Fields that identify one physical cheque; bankCode is the normalized bank (see banks.bank_code)
+CHEQUE_KEY_FIELDS = ("bankCode", "chequeNumber", "accountNumber")
+CHEQUE_KEY_INDEX = "cheque_code_unique"
+# The earlier unique index, keyed on the free-text bank name
+LEGACY_CHEQUE_KEY_INDEX = "cheque_key_unique"
+
+# MongoDB error code for unique index violations
+DUPLICATE_KEY_ERROR = 11000
+
+MIGRATE_KEYS_HINT = "run `python storage.py --migrate-keys` to set bank codes and set duplicates aside"
+
+# Indexes backing the Dashboard filters and search, plus duplicate prevention
+CHEQUE_INDEXES = [
+    ([("bank", ASCENDING)], {"name": "bank_1"}),
+    ([("chequeNumber", ASCENDING)], {"name": "chequeNumber_1"}),
+    ([("accountNumber", ASCENDING)], {"name": "accountNumber_1"}),
+    ([("payee", TEXT)], {"name": "payee_text", "default_language": "none"}),
+    # Cheques without both numbers cannot be told apart, so they are left out of the unique index
+    ([(field, ASCENDING) for field in CHEQUE_KEY_FIELDS],
+     {"name": CHEQUE_KEY_INDEX, "unique": True,
+      "partialFilterExpression": {"chequeNumber": {"$gt": ""}, "accountNumber": {"$gt": ""}}}),
+]
+
+
+def ensure_indexes(collection, unique=True):
+    """
+    Create the cheque indexes if they do not exist yet
+    Raises RuntimeError when stored cheques keep the unique cheque key from being enforced, i.e. they
+    predate bank codes or hold duplicates; other index failures (e.g. a read-only user) are only logged.
+    :param unique: Also create the unique cheque key index; readers leave it to the writers and only warn
+    """
+    if not unique:
+        if CHEQUE_KEY_INDEX not in collection.index_information():
+            logging.warning(f"The unique cheque key index is missing; {MIGRATE_KEYS_HINT}")
+    elif CHEQUE_KEY_INDEX not in collection.index_information() and \
+            collection.find_one({"bankCode": {"$exists": False}}, {"_id": 1}) is not None:
+        raise RuntimeError(f"Stored cheques have no bank codes yet; {MIGRATE_KEYS_HINT}")
+    for keys, options in CHEQUE_INDEXES:
+        if options.get("unique") and not unique:
+            continue
+        try:
+            collection.create_index(keys, **options)
+        except Exception as e:
+            if options.get("unique") and getattr(e, "code", None) == DUPLICATE_KEY_ERROR:
+                raise RuntimeError(f"Duplicate cheques prevent the unique index {options['name']}; "
+                                   f"{MIGRATE_KEYS_HINT}") from e
+            logging.warning(f"Could not create index {options['name']}: {e}")
+
+
+def build_cheque_query(bank=None, search=None):
+    """
+    Build an index-friendly MongoDB filter for the Dashboard
+    Numeric searches match cheque/account number prefixes; anything else is a payee text search.
+    """
+    query = {}
+    if bank and bank != "All":
+        query["bank"] = bank
+
+    search = (search or "").strip()
+    if search:
+        if search.isdigit():
+            prefix = {"$regex": f"^{re.escape(search)}"}
+            query["$or"] = [{"chequeNumber": prefix}, {"accountNumber": prefix}]
+        else:
+            query["$text"] = {"$search": search}
+    return query
+
+
+def count_cheques(collection, query):
+    """Count the cheques matching a filter."""
+    if not query:
+        return collection.estimated_document_count()
+    return collection.count_documents(query)
+
+
+def fetch_cheque_page(collection, query, page, page_size):
+    """Fetch one page (1-based) of matching cheques, newest first, without the _id field."""
+    cursor = (
+        collection.find(query, {"_id": 0})
+        .sort("_id", DESCENDING)
+        .skip((page - 1) * page_size)
+        .limit(page_size)
+    )
+    return list(cursor)
+
+
+def list_banks(collection):
+    """Return the distinct bank names, served from the bank index."""
+    return sorted(bank for bank in collection.distinct("bank") if bank)
@@ -0,0 +1,103 @@
+# rollups.py
+import logging
+import argparse
+from collections import Counter
+
+from pymongo import UpdateOne
+
+# Pre-aggregated metrics read by the Analytics page
+DAILY_ROLLUP_COLLECTION = "cheque_rollups_daily"
+BANK_ROLLUP_COLLECTION = "cheque_rollups_bank"
+
+# A cheque counts as successful when its amount in numbers was extracted
+SUCCESS_FIELD = "amount in numbers"
+
+
+def _rollup_day(cheque):
+    """Return the YYYY-MM-DD day of a cheque's ISO timestamp, or None."""
+    timestamp = cheque.get("timestamp")
+    return timestamp[:10] if isinstance(timestamp, str) and timestamp else None
+
+
+def _increments(keys):
+    """Turn (key, successful) pairs into upserts that bump total/successful counters."""
+    totals, successes = Counter(), Counter()
+    for key, successful in keys:
+        if key is None:
+            continue
+        totals[key] += 1
+        successes[key] += int(successful)
+    return [
+        UpdateOne({"_id": key}, {"$inc": {"total": totals[key], "successful": successes[key]}}, upsert=True)
+        for key in totals
+    ]
+
+
+def update_rollups(db, cheques):
+    """Fold newly inserted cheques into the per-day and per-bank rollup documents."""
+    try:
+        daily = _increments((_rollup_day(c), c.get(SUCCESS_FIELD) is not None) for c in cheques)
+        banks = _increments((c.get("bank") or None, c.get(SUCCESS_FIELD) is not None) for c in cheques)
+        if daily:
+            db[DAILY_ROLLUP_COLLECTION].bulk_write(daily, ordered=False)
+        if banks:
+            db[BANK_ROLLUP_COLLECTION].bulk_write(banks, ordered=False)
+    except Exception as e:
+        logging.error(f"Error updating cheque rollups: {e}")
+
+
+def _success_expression():
+    """Aggregation expression that is 1 for a successful cheque and 0 otherwise."""
+    return {"$cond": [{"$ne": [{"$ifNull": [f"${SUCCESS_FIELD}", None]}, None]}, 1, 0]}
+
+
+def backfill_rollups(db, collection_name):
+    """Rebuild both rollup collections from every stored cheque with an aggregation pipeline."""
+    collection = db[collection_name]
+    collection.aggregate([
+        {"$match": {"timestamp": {"$type": "string"}}},
+        {"$group": {
+            "_id": {"$substrBytes": ["$timestamp", 0, 10]},
+            "total": {"$sum": 1},
+            "successful": {"$sum": _success_expression()},
+        }},
+        {"$out": DAILY_ROLLUP_COLLECTION},
+    ])
+    collection.aggregate([
+        {"$match": {"bank": {"$nin": [None, ""]}}},
+        {"$group": {
+            "_id": "$bank",
+            "total": {"$sum": 1},
+            "successful": {"$sum": _success_expression()},
+        }},
+        {"$out": BANK_ROLLUP_COLLECTION},
+    ])
+    logging.info("✅ Cheque rollups rebuilt.")
+
+
+def load_daily_rollups(db):
+    """Return the per-day rollup documents ordered by day."""
+    return list(db[DAILY_ROLLUP_COLLECTION].find().sort("_id", 1))
+
+
+def load_bank_rollups(db):
+    """Return the per-bank rollup documents."""
+    return list(db[BANK_ROLLUP_COLLECTION].find())
+
+
+if __name__ == "__main__":
+    from utils import COLLECTION_NAME, get_db_connection, configure_logging
+
+    configure_logging()
+
+    parser = argparse.ArgumentParser(description="Maintain the pre-aggregated cheque rollups.")
+    parser.add_argument("--backfill", action="store_true", help="rebuild the rollups from all stored cheques")
+    args = parser.parse_args()
+
+    if args.backfill:
+        db, connection_status = get_db_connection()
+        print(connection_status)
+        if db is not None:
+            backfill_rollups(db, COLLECTION_NAME)
+    else:
+        parser.print_help()
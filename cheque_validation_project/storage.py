@@ -0,0 +1,575 @@
+# storage.py
+"""
+Cheque storage backends.
+
+MongoChequeStore keeps the shared MongoDB deployment; SQLiteChequeStore keeps everything in one
+local file (WAL mode, one transaction per bulk insert) so a node can run the whole pipeline
+without a database server. STORAGE_BACKEND picks the backend for the workers and the pages.
+"""
+import os
+import json
+import logging
+import sqlite3
+import argparse
+import threading
+from collections import namedtuple
+
+from pymongo import ASCENDING, DESCENDING, WriteConcern, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from banks import bank_code
+from queries import (ensure_indexes, build_cheque_query, count_cheques, fetch_cheque_page, list_banks,
+                     CHEQUE_KEY_FIELDS, LEGACY_CHEQUE_KEY_INDEX, DUPLICATE_KEY_ERROR, MIGRATE_KEYS_HINT)
+from rollups import update_rollups, backfill_rollups, load_daily_rollups, load_bank_rollups, SUCCESS_FIELD
+
+# Backend settings
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
+# A file of its own; the legacy cheques.db is tracked in git and left untouched
+SQLITE_PATH = os.getenv("SQLITE_PATH", "cheque_store.db")
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "majority")
+
+DB_NAME = "cheque_processing_db"
+COLLECTION_NAME = "cheque_details"
+# Image fingerprints of stored cheques, looked up before OCR
+FINGERPRINT_COLLECTION = "cheque_fingerprints"
+# Cheques set aside by --migrate-keys as repeats of an earlier one
+DUPLICATE_COLLECTION = "cheque_details_duplicates"
+
+InsertResult = namedtuple("InsertResult", ["inserted_ids", "duplicates", "failed"])
+
+
+def set_bank_codes(cheques):
+    """Add the normalized "bankCode" that the unique cheque key uses to each cheque."""
+    for cheque in cheques:
+        cheque["bankCode"] = bank_code(cheque.get("bank"))
+
+
+def make_write_concern(w):
+    """Build a WriteConcern from a setting such as "majority" or "1"."""
+    if isinstance(w, str) and w.isdigit():
+        w = int(w)
+    return WriteConcern(w=w)
+
+
+class ChequeStore:
+    """
+    Base class for cheque storage backends.
+    Cheques are dicts of extracted fields; inserted cheques get their backend id as "_id" and their
+    "bankCode", and a cheque with the same bank code, cheque number and account number is a duplicate.
+    Queries take the Dashboard filters (bank name, and a number prefix or payee search).
+    """
+
+    def insert_many(self, cheques):
+        """Insert cheques, skipping ones already stored; returns InsertResult."""
+        raise NotImplementedError
+
+    def insert(self, cheque):
+        """Insert one cheque; returns its id, or None if it is a duplicate or the write failed."""
+        result = self.insert_many([cheque])
+        return result.inserted_ids[0] if result.inserted_ids else None
+
+    def query(self, bank=None, search=None, page=1, page_size=50):
+        """One page (1-based) of matching cheques, newest first, without "_id"."""
+        raise NotImplementedError
+
+    def count(self, bank=None, search=None):
+        raise NotImplementedError
+
+    def iter_batches(self, bank=None, search=None, batch_size=5000):
+        """Yield lists of matching cheques (newest first, without "_id"), batch_size at a time."""
+        raise NotImplementedError
+
+    def list_banks(self):
+        raise NotImplementedError
+
+    def aggregate(self):
+        """Return (daily, banks) rows of {"_id": day or bank, "total": n, "successful": n}."""
+        raise NotImplementedError
+
+    def get(self, cheque_id):
+        """A stored cheque by id, with "_id", or None."""
+        raise NotImplementedError
+
+    def find_by_key(self, key):
+        """The stored cheque matching a cheque key (see dedup.cheque_key), with "_id", or None."""
+        raise NotImplementedError
+
+    def add_fingerprint(self, fingerprint):
+        """Store an image fingerprint: a dict of hash, version, bands, cheque_id and created."""
+        raise NotImplementedError
+
+    def find_fingerprints(self, bands, version):
+        """Yield (hash, cheque_id) for stored fingerprints sharing at least one band key."""
+        raise NotImplementedError
+
+    def data_version(self):
+        """Token that changes whenever cheques are inserted or removed."""
+        raise NotImplementedError
+
+
+class MongoChequeStore(ChequeStore):
+    def __init__(self, db, collection_name=COLLECTION_NAME, write_concern=MONGO_WRITE_CONCERN, read_only=False):
+        """
+        Cheques in a MongoDB collection, with pre-aggregated rollups for aggregate()
+        :param db: pymongo Database
+        :param collection_name: Collection holding the cheque documents
+        :param write_concern: Write concern for inserts, e.g. "majority" or "1"
+        :param read_only: Only read cheques; the unique cheque key index is then left to the writers
+        """
+        self.db = db
+        self.collection = db[collection_name]
+        self.writes = self.collection.with_options(write_concern=make_write_concern(write_concern))
+        self.fingerprints = db[FINGERPRINT_COLLECTION]
+        ensure_indexes(self.collection, unique=not read_only)
+        try:
+            self.fingerprints.create_index([("bands", ASCENDING)], name="bands_1")
+        except Exception as e:
+            logging.warning(f"Could not create index bands_1: {e}")
+
+    def insert_many(self, cheques):
+        set_bank_codes(cheques)
+        duplicates = 0
+        try:
+            self.writes.insert_many(cheques, ordered=False)
+            written = cheques
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            failed_indexes = {error["index"] for error in errors}
+            written = [doc for i, doc in enumerate(cheques) if i not in failed_indexes]
+            # Duplicate keys are cheques that are already stored, not failures
+            duplicates = sum(1 for error in errors if error.get("code") == DUPLICATE_KEY_ERROR)
+            if len(errors) > duplicates:
+                logging.error(f"Bulk insert wrote {len(written)} of {len(cheques)} cheques: {errors}")
+        except Exception as e:
+            written = []
+            logging.error(f"Error bulk inserting cheque details: {e}")
+        if written:
+            update_rollups(self.db, written)
+        inserted = [doc["_id"] for doc in written]
+        return InsertResult(inserted, duplicates, len(cheques) - len(inserted) - duplicates)
+
+    def query(self, bank=None, search=None, page=1, page_size=50):
+        return fetch_cheque_page(self.collection, build_cheque_query(bank, search), page, page_size)
+
+    def count(self, bank=None, search=None):
+        return count_cheques(self.collection, build_cheque_query(bank, search))
+
+    def iter_batches(self, bank=None, search=None, batch_size=5000):
+        cursor = (self.collection.find(build_cheque_query(bank, search), {"_id": 0})
+                  .sort("_id", DESCENDING).batch_size(batch_size))
+        batch = []
+        for cheque in cursor:
+            batch.append(cheque)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def list_banks(self):
+        return list_banks(self.collection)
+
+    def aggregate(self):
+        return load_daily_rollups(self.db), load_bank_rollups(self.db)
+
+    def get(self, cheque_id):
+        return self.collection.find_one({"_id": cheque_id})
+
+    def find_by_key(self, key):
+        return self.collection.find_one(key)
+
+    def add_fingerprint(self, fingerprint):
+        self.fingerprints.insert_one(dict(fingerprint))
+
+    def find_fingerprints(self, bands, version):
+        for candidate in self.fingerprints.find({"bands": {"$in": bands}, "version": version},
+                                                {"hash": 1, "cheque_id": 1}):
+            yield candidate["hash"], candidate["cheque_id"]
+
+    def data_version(self):
+        newest = self.collection.find_one({}, {"_id": 1}, sort=[("_id", DESCENDING)])
+        return self.collection.estimated_document_count(), str(newest["_id"]) if newest else None
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cheque_details (
+    id INTEGER PRIMARY KEY,
+    bank TEXT NOT NULL,
+    bank_code TEXT NOT NULL DEFAULT '',
+    cheque_number TEXT NOT NULL,
+    account_number TEXT NOT NULL,
+    payee TEXT,
+    day TEXT,
+    successful INTEGER NOT NULL,
+    details TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cheque_details_bank ON cheque_details (bank);
+CREATE INDEX IF NOT EXISTS idx_cheque_details_cheque_number ON cheque_details (cheque_number);
+CREATE INDEX IF NOT EXISTS idx_cheque_details_account_number ON cheque_details (account_number);
+CREATE INDEX IF NOT EXISTS idx_cheque_details_day ON cheque_details (day);
+CREATE VIRTUAL TABLE IF NOT EXISTS cheque_payee_search USING fts5 (
+    payee, content='cheque_details', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS cheque_details_search_insert AFTER INSERT ON cheque_details BEGIN
+    INSERT INTO cheque_payee_search (rowid, payee) VALUES (new.id, new.payee);
+END;
+CREATE TRIGGER IF NOT EXISTS cheque_details_search_delete AFTER DELETE ON cheque_details BEGIN
+    INSERT INTO cheque_payee_search (cheque_payee_search, rowid, payee) VALUES ('delete', old.id, old.payee);
+END;
+CREATE TABLE IF NOT EXISTS cheque_fingerprints (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    cheque_id INTEGER NOT NULL,
+    created TEXT
+);
+CREATE TABLE IF NOT EXISTS cheque_fingerprint_bands (
+    band INTEGER NOT NULL,
+    fingerprint_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cheque_fingerprint_bands_band ON cheque_fingerprint_bands (band);
+CREATE TABLE IF NOT EXISTS cheque_details_duplicates (
+    id INTEGER PRIMARY KEY,
+    duplicate_of INTEGER NOT NULL,
+    details TEXT NOT NULL
+);
+"""
+
+# Created once the stored rows have bank codes and no duplicates (see migrate_sqlite_keys)
+SQLITE_KEY_INDEX = """
+CREATE UNIQUE INDEX IF NOT EXISTS cheque_code_unique ON cheque_details (bank_code, cheque_number, account_number)
+    WHERE cheque_number > '' AND account_number > ''
+"""
+
+
+def _ensure_sqlite_key_index(conn):
+    """Create the unique cheque key index, or raise RuntimeError when the stored rows prevent it."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(cheque_details)")]
+    if "bank_code" not in columns:
+        raise RuntimeError(f"Stored cheques have no bank codes yet; {MIGRATE_KEYS_HINT}")
+    try:
+        conn.execute(SQLITE_KEY_INDEX)
+    except sqlite3.IntegrityError as e:
+        raise RuntimeError(f"Duplicate cheques prevent the unique cheque key index; {MIGRATE_KEYS_HINT}") from e
+
+
+def _prefix_bounds(prefix):
+    """Half-open string range holding every value that starts with prefix (index-friendly, unlike LIKE)."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class SQLiteChequeStore(ChequeStore):
+    def __init__(self, path=SQLITE_PATH, read_only=False):
+        """
+        Cheques in a local SQLite file; safe to use from several threads and processes at once
+        :param path: SQLite file; the cheque fields used by filters and dedup are indexed columns
+        :param read_only: Only read cheques; the unique cheque key index is then left to the writers
+        """
+        self.path = path
+        self.read_only = read_only
+        self._local = threading.local()
+
+    def _db(self):
+        """Open this thread's connection and create the tables on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # With WAL, NORMAL only syncs at checkpoints; a power loss can drop the last commits, not corrupt
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SQLITE_SCHEMA)
+            if not self.read_only:
+                _ensure_sqlite_key_index(conn)
+            elif conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'cheque_code_unique'").fetchone() is None:
+                logging.warning(f"The unique cheque key index is missing; {MIGRATE_KEYS_HINT}")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row(cheque):
+        """Indexed columns and JSON details of a cheque."""
+        timestamp = cheque.get("timestamp")
+        details = {key: value for key, value in cheque.items() if key != "_id"}
+        return (
+            cheque.get("bank") or "",
+            cheque.get("bankCode") or "",
+            cheque.get("chequeNumber") or "",
+            cheque.get("accountNumber") or "",
+            cheque.get("payee"),
+            timestamp[:10] if isinstance(timestamp, str) and timestamp else None,
+            int(cheque.get(SUCCESS_FIELD) is not None),
+            json.dumps(details, ensure_ascii=False, default=str),
+        )
+
+    @staticmethod
+    def _cheque(row, with_id=True):
+        cheque = json.loads(row["details"])
+        if with_id:
+            cheque["_id"] = row["id"]
+        return cheque
+
+    def insert_many(self, cheques):
+        conn = self._db()
+        set_bank_codes(cheques)
+        inserted, duplicates = [], 0
+        try:
+            # One transaction per batch; the unique key index turns repeats into ignored rows
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for cheque in cheques:
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO cheque_details "
+                        "(bank, bank_code, cheque_number, account_number, payee, day, successful, details) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        self._row(cheque),
+                    )
+                    if cursor.rowcount:
+                        inserted.append((cheque, cursor.lastrowid))
+                    else:
+                        duplicates += 1
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            logging.error(f"Error bulk inserting cheque details: {e}")
+            return InsertResult([], 0, len(cheques))
+        for cheque, cheque_id in inserted:
+            cheque["_id"] = cheque_id
+        return InsertResult([cheque_id for _, cheque_id in inserted], duplicates, 0)
+
+    def _where(self, bank, search):
+        """SQL filter matching build_cheque_query: bank, plus number prefix or payee words."""
+        clauses, params = [], []
+        if bank and bank != "All":
+            clauses.append("bank = ?")
+            params.append(bank)
+
+        search = (search or "").strip()
+        if search:
+            if search.isdigit():
+                low, high = _prefix_bounds(search)
+                clauses.append("((cheque_number >= ? AND cheque_number < ?) OR "
+                               "(account_number >= ? AND account_number < ?))")
+                params += [low, high, low, high]
+            else:
+                # Any of the words, like a MongoDB $text search
+                words = " OR ".join('"' + word.replace('"', '""') + '"' for word in search.split())
+                clauses.append("id IN (SELECT rowid FROM cheque_payee_search WHERE cheque_payee_search MATCH ?)")
+                params.append(words)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def query(self, bank=None, search=None, page=1, page_size=50):
+        where, params = self._where(bank, search)
+        rows = self._db().execute(
+            f"SELECT id, details FROM cheque_details{where} ORDER BY id DESC LIMIT ? OFFSET ?",
+            params + [page_size, (page - 1) * page_size],
+        ).fetchall()
+        return [self._cheque(row, with_id=False) for row in rows]
+
+    def count(self, bank=None, search=None):
+        where, params = self._where(bank, search)
+        return self._db().execute(f"SELECT COUNT(*) FROM cheque_details{where}", params).fetchone()[0]
+
+    def iter_batches(self, bank=None, search=None, batch_size=5000):
+        where, params = self._where(bank, search)
+        cursor = self._db().execute(f"SELECT id, details FROM cheque_details{where} ORDER BY id DESC", params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [self._cheque(row, with_id=False) for row in rows]
+
+    def list_banks(self):
+        rows = self._db().execute("SELECT DISTINCT bank FROM cheque_details WHERE bank != '' ORDER BY bank")
+        return [row["bank"] for row in rows]
+
+    def aggregate(self):
+        conn = self._db()
+        daily = conn.execute(
+            "SELECT day AS _id, COUNT(*) AS total, SUM(successful) AS successful FROM cheque_details "
+            "WHERE day IS NOT NULL GROUP BY day ORDER BY day"
+        ).fetchall()
+        banks = conn.execute(
+            "SELECT bank AS _id, COUNT(*) AS total, SUM(successful) AS successful FROM cheque_details "
+            "WHERE bank != '' GROUP BY bank"
+        ).fetchall()
+        return [dict(row) for row in daily], [dict(row) for row in banks]
+
+    def get(self, cheque_id):
+        row = self._db().execute("SELECT id, details FROM cheque_details WHERE id = ?", (cheque_id,)).fetchone()
+        return self._cheque(row) if row is not None else None
+
+    def find_by_key(self, key):
+        row = self._db().execute(
+            "SELECT id, details FROM cheque_details WHERE bank_code = ? AND cheque_number = ? AND account_number = ?",
+            (key.get("bankCode") or "", key.get("chequeNumber") or "", key.get("accountNumber") or ""),
+        ).fetchone()
+        return self._cheque(row) if row is not None else None
+
+    def add_fingerprint(self, fingerprint):
+        conn = self._db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            fingerprint_id = conn.execute(
+                "INSERT INTO cheque_fingerprints (hash, version, cheque_id, created) VALUES (?, ?, ?, ?)",
+                (fingerprint["hash"], fingerprint["version"], fingerprint["cheque_id"], fingerprint.get("created")),
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO cheque_fingerprint_bands (band, fingerprint_id) VALUES (?, ?)",
+                [(band, fingerprint_id) for band in fingerprint["bands"]],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def find_fingerprints(self, bands, version):
+        placeholders = ", ".join("?" * len(bands))
+        rows = self._db().execute(
+            "SELECT hash, cheque_id FROM cheque_fingerprints WHERE version = ? AND id IN "
+            f"(SELECT fingerprint_id FROM cheque_fingerprint_bands WHERE band IN ({placeholders}))",
+            [version] + list(bands),
+        )
+        for row in rows:
+            yield row["hash"], row["cheque_id"]
+
+    def data_version(self):
+        return tuple(self._db().execute("SELECT COUNT(*), MAX(id) FROM cheque_details").fetchone())
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_cheque_store():
+    """
+    Return (store, status message) for STORAGE_BACKEND; store is None when MongoDB is unreachable.
+    The MongoDB store follows utils.get_db_connection, so it reconnects after failed health checks.
+    """
+    global _store
+    if STORAGE_BACKEND == "sqlite":
+        with _store_lock:
+            if _store is None:
+                _store = SQLiteChequeStore()
+        return _store, f"✅ Using SQLite storage at {SQLITE_PATH}"
+
+    from utils import get_db_connection
+    db, connection_status = get_db_connection()
+    if db is None:
+        return None, connection_status
+    with _store_lock:
+        if _store is None or _store.db.client is not db.client:
+            _store = MongoChequeStore(db)
+    return _store, connection_status
+
+
+def migrate_mongo_keys(db, collection_name=COLLECTION_NAME, batch_size=1000):
+    """
+    Prepare a MongoDB cheque collection for the bank-code key: set missing bank codes, move every
+    repeat of an earlier cheque (same key) to DUPLICATE_COLLECTION, then build the unique index
+    :return: (cheques given a bank code, duplicates moved)
+    """
+    collection = db[collection_name]
+    backfilled, updates = 0, []
+    for cheque in collection.find({"bankCode": {"$exists": False}}, {"bank": 1}):
+        updates.append(UpdateOne({"_id": cheque["_id"]}, {"$set": {"bankCode": bank_code(cheque.get("bank"))}}))
+        if len(updates) >= batch_size:
+            backfilled += collection.bulk_write(updates, ordered=False).modified_count
+            updates = []
+    if updates:
+        backfilled += collection.bulk_write(updates, ordered=False).modified_count
+
+    # The oldest cheque of each key stays; its repeats keep their fingerprints pointing at it
+    moved = 0
+    groups = collection.aggregate([
+        {"$match": {"chequeNumber": {"$gt": ""}, "accountNumber": {"$gt": ""}}},
+        {"$sort": {"_id": ASCENDING}},
+        {"$group": {"_id": {field: f"${field}" for field in CHEQUE_KEY_FIELDS}, "ids": {"$push": "$_id"}}},
+        {"$match": {"ids.1": {"$exists": True}}},
+    ], allowDiskUse=True)
+    for group in groups:
+        kept, repeats = group["ids"][0], group["ids"][1:]
+        cheques = [dict(cheque, duplicateOf=kept) for cheque in collection.find({"_id": {"$in": repeats}})]
+        db[DUPLICATE_COLLECTION].insert_many(cheques)
+        db[FINGERPRINT_COLLECTION].update_many({"cheque_id": {"$in": repeats}}, {"$set": {"cheque_id": kept}})
+        collection.delete_many({"_id": {"$in": repeats}})
+        moved += len(repeats)
+    if moved:
+        backfill_rollups(db, collection_name)
+
+    if LEGACY_CHEQUE_KEY_INDEX in collection.index_information():
+        collection.drop_index(LEGACY_CHEQUE_KEY_INDEX)
+    ensure_indexes(collection)
+    return backfilled, moved
+
+
+def migrate_sqlite_keys(path=SQLITE_PATH):
+    """
+    Prepare an SQLite cheque store for the bank-code key: recompute every bank code, move every
+    repeat of an earlier cheque (same key) to cheque_details_duplicates, then build the unique index
+    :return: (cheques given a bank code, duplicates moved)
+    """
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SQLITE_SCHEMA)
+        if "bank_code" not in [row[1] for row in conn.execute("PRAGMA table_info(cheque_details)")]:
+            conn.execute("ALTER TABLE cheque_details ADD COLUMN bank_code TEXT NOT NULL DEFAULT ''")
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            updates = []
+            for cheque_id, details in conn.execute("SELECT id, details FROM cheque_details").fetchall():
+                cheque = json.loads(details)
+                set_bank_codes([cheque])
+                updates.append((cheque["bankCode"], json.dumps(cheque, ensure_ascii=False, default=str), cheque_id))
+            conn.executemany("UPDATE cheque_details SET bank_code = ?, details = ? WHERE id = ?", updates)
+
+            # The oldest cheque of each key stays; its repeats keep their fingerprints pointing at it
+            repeats = conn.execute(
+                "SELECT later.id, MIN(kept.id) FROM cheque_details later JOIN cheque_details kept "
+                "ON kept.bank_code = later.bank_code AND kept.cheque_number = later.cheque_number "
+                "AND kept.account_number = later.account_number AND kept.id < later.id "
+                "WHERE later.cheque_number > '' AND later.account_number > '' GROUP BY later.id"
+            ).fetchall()
+            for repeat_id, kept_id in repeats:
+                conn.execute("INSERT INTO cheque_details_duplicates (id, duplicate_of, details) "
+                             "SELECT id, ?, details FROM cheque_details WHERE id = ?", (kept_id, repeat_id))
+                conn.execute("UPDATE cheque_fingerprints SET cheque_id = ? WHERE cheque_id = ?", (kept_id, repeat_id))
+                conn.execute("DELETE FROM cheque_details WHERE id = ?", (repeat_id,))
+
+            conn.execute(f"DROP INDEX IF EXISTS {LEGACY_CHEQUE_KEY_INDEX}")
+            _ensure_sqlite_key_index(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(updates), len(repeats)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    from utils import get_db_connection, configure_logging
+
+    configure_logging()
+
+    parser = argparse.ArgumentParser(description="Maintain the STORAGE_BACKEND cheque store.")
+    parser.add_argument("--migrate-keys", action="store_true",
+                        help="key stored cheques on bank codes, moving duplicates aside")
+    args = parser.parse_args()
+
+    if args.migrate_keys:
+        if STORAGE_BACKEND == "sqlite":
+            backfilled, moved = migrate_sqlite_keys()
+        else:
+            db, connection_status = get_db_connection()
+            print(connection_status)
+            if db is None:
+                parser.exit(1)
+            backfilled, moved = migrate_mongo_keys(db)
+        print(f"Set bank codes on {backfilled} cheque(s); moved {moved} duplicate(s) aside")
+    else:
+        parser.print_help()
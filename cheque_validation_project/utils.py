@@ -1,185 +1,226 @@
 # utils.py
 import os
-import re
-import json
+import time
 import logging
-from tempfile import NamedTemporaryFile
-from datetime import datetime
-
-import cv2
-import numpy as np
-from PIL import Image, ImageEnhance, ImageFilter
-import pytesseract
-from pdf2image import convert_from_path
-import google.generativeai as gen_ai
+import threading
+
 from dotenv import load_dotenv
-from pymongo import MongoClient, WriteConcern
+from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
 
 from border_processing import ChequeBorderProcessor
+from preprocessing import get_preprocessor, to_bgr
+from artifacts import get_artifact_store
+from storage import DB_NAME, COLLECTION_NAME
+from extraction import extract_with_confidence
+from metrics import span, increment
+from gemini_engine import gemini_refiner
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler("app.log"), logging.StreamHandler()]
-)
-
 # MongoDB connection details
 MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME = "cheque_processing_db"
-COLLECTION_NAME = "cheque_details"
-
-# Initialize border processor
-border_processor = ChequeBorderProcessor(output_size=(800, 400))
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_HEALTH_CHECK_INTERVAL = float(os.getenv("MONGO_HEALTH_CHECK_INTERVAL", "30"))
+
+# PDF rasterization settings
+PDF_DPI = int(os.getenv("PDF_DPI", "200"))
+PDF_PAGE_WINDOW = int(os.getenv("PDF_PAGE_WINDOW", "4"))
+
+# Border detection runs on a copy downscaled to this longest side ("0" detects at full resolution)
+BORDER_DETECTION_MAX_DIM = int(os.getenv("BORDER_DETECTION_MAX_DIM", "1000"))
+
+LOG_FILE = os.getenv("LOG_FILE", "app.log")
+
+def configure_logging():
+    """Log to the console and LOG_FILE; entry points call this (it is a no-op once logging is set up)."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[logging.FileHandler(LOG_FILE), logging.StreamHandler()]
+    )
+
+# Border processor, created on first use
+_border_processor = None
+_border_processor_lock = threading.Lock()
+
+def get_border_processor():
+    """Return the shared ChequeBorderProcessor, creating it on first use."""
+    global _border_processor
+    if _border_processor is None:
+        with _border_processor_lock:
+            if _border_processor is None:
+                _border_processor = ChequeBorderProcessor(output_size=(800, 400),
+                                                          detection_max_dim=BORDER_DETECTION_MAX_DIM or None)
+    return _border_processor
+
+# Cache of refined results keyed by normalized OCR text + prompt/model version
+gemini_cache = gemini_refiner.cache
 
 # Image processing functions
 def preprocess_image(image):
-    """Enhance image quality for OCR processing."""
-    image = image.convert("L")
-    image = image.filter(ImageFilter.SHARPEN)
-    enhancer = ImageEnhance.Contrast(image)
-    return enhancer.enhance(2)
-
-def process_and_crop_cheque(uploaded_image):
-    """Detect and crop cheque borders using OpenCV."""
-    try:
-        cv_image = cv2.cvtColor(np.array(uploaded_image), cv2.COLOR_RGB2BGR)
+    """Enhance image quality for OCR processing (grayscale, sharpen, contrast) on an ndarray or PIL image."""
+    with span("preprocessing"):
+        return get_preprocessor().process(image)
 
-        with NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-            uploaded_image.save(temp_file.name)
-            output_path = os.path.join("output_images", f"processed_{os.path.basename(temp_file.name)}")
-
-            if border_processor.process_image(temp_file.name, output_path):
-                processed_image = cv2.imread(output_path)
-                return Image.fromarray(cv2.cvtColor(processed_image, cv2.COLOR_BGR2RGB))
-
-        return uploaded_image
+def crop_cheque(uploaded_image, output_path=None):
+    """Detect and crop cheque borders in memory; returns (BGR ndarray, border found), the whole page if not."""
+    try:
+        return get_border_processor().process_array(uploaded_image, output_path), True
 
     except Exception as e:
+        increment("border_fallbacks")
         logging.warning(f"Border detection failed: {str(e)}")
-        return uploaded_image
-
-def process_pdf(uploaded_file):
-    """Process each page of the uploaded PDF and return processed images."""
-    images = convert_from_path(uploaded_file)  # Line 68
-    processed_images = []
-    for i, image in enumerate(images):
+        return to_bgr(uploaded_image), False
+
+def process_and_crop_cheque(uploaded_image, output_path=None):
+    """Detect and crop cheque borders using OpenCV, entirely in memory; returns a BGR ndarray."""
+    return crop_cheque(uploaded_image, output_path)[0]
+
+def rasterize_pdf(uploaded_file, dpi=PDF_DPI, grayscale=False, window=PDF_PAGE_WINDOW):
+    """Yield the PDF's pages as PIL images, rasterizing a few pages at a time."""
+    from pdf2image import convert_from_path, pdfinfo_from_path
+
+    page_count = pdfinfo_from_path(uploaded_file)["Pages"]
+    for first_page in range(1, page_count + 1, window):
+        last_page = min(first_page + window - 1, page_count)
+        with span("pdf_rasterize"):
+            images = convert_from_path(uploaded_file, dpi=dpi, grayscale=grayscale,
+                                       first_page=first_page, last_page=last_page)
+        yield from images
+
+def process_pdf(uploaded_file, dpi=PDF_DPI, grayscale=False, window=PDF_PAGE_WINDOW, save=True):
+    """Rasterize the PDF a few pages at a time and yield each cropped cheque as it is ready."""
+    for image in rasterize_pdf(uploaded_file, dpi, grayscale, window):
         processed_image = process_and_crop_cheque(image)
-        processed_images.append(processed_image)
-        processed_image.save(os.path.join("output_images", f"processed_page_{i + 1}.jpg"))
-    return processed_images
+        if save:
+            get_artifact_store().put(processed_image)
+        yield processed_image
 
 # Text processing functions
 def extract_cheque_info(text):
     """Extract cheque details using regex."""
-    cheque_info = {
-        "chequeNumber": re.search(r"\b(\d{6,12})\b", text),
-        "accountNumber": re.search(r"\b(\d{10,16})\b", text),
-        "amount_numbers": re.search(r"\b(\d{1,3}(?:,\d{3})*\.\d{2})\b", text),
-        "amount_words": re.search(r"(?i)(?:Rupees|INR|Amount|Rs\.)\s+([a-zA-Z\s-]+)", text),
-        "date": re.search(r"\b(\d{2}/\d{2}/\d{4})\b", text),
-        "payee": re.search(r"Pay(?: to|ee)?[:\s]+(.+)", text, re.IGNORECASE),
-        "bank": re.search(r"Bank[:\s]*(.*)", text, re.IGNORECASE),
+    data = extract_with_confidence(text).data
+    extracted_details = {
+        "chequeNumber": data["chequeNumber"],
+        "accountNumber": data["accountNumber"],
+        "amount_numbers": data["amount in numbers"],
+        "amount_words": data["amount in words"],
+        "date": data["date"],
+        "payee": data["payee"],
+        "bank": data["bank"],
     }
+    return {field: value or None for field, value in extracted_details.items()}
 
-    extracted_details = {field: match.group(1) if match else None for field, match in cheque_info.items()}
-    return extracted_details
-
-def refine_text_with_gemini(extracted_text):
-    """Use Gemini API to refine extracted text."""
-    try:
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            logging.error("❌ Gemini API Key not found! Please set the GEMINI_API_KEY environment variable.")
-            return None
-
-        gen_ai.configure(api_key=api_key)  # Configure Gemini with the API key
-        model = gen_ai.GenerativeModel("gemini-2.0-flash")
-        prompt = f"""
-Extract and structure the following cheque details in JSON format with the fields below. The extracted text is messy and fragmented, so carefully analyze and connect the relevant parts to extract the correct values. If a field is not found, leave it as an empty string (""), not null.
-
-Fields:
-- chequeNumber: The cheque number (a numeric value, typically 6-12 digits).
-- accountNumber: The account number (a numeric value, typically 10-16 digits).
-- amount in numbers: The amount in numeric format (e.g., 1000.00).
-- amount in words: The amount in words (e.g., "One thousand only").
-- date: The date on the cheque. It can be in any of the following formats:
-  - `DD-MM-YYYY` (e.g., 10-02-2015)
-  - `DD/MM/YYYY` (e.g., 10/02/2015)
-  - `DD MM YYYY` (e.g., 10 02 2015)
-  - `DDth Month YYYY` (e.g., 10th February 2015)
-  - `Month DD, YYYY` (e.g., February 10, 2015)
-  - `YYYY-MM-DD` (e.g., 2015-02-10)
-  - Abbreviated formats (e.g., 10-Feb-2015 or 10/Feb/2015)
-  If the date is fragmented or mixed with other text (e.g., "Date_10- 02-15" or "10-02-2015 fests"), extract only the date part.
-- payee: The name of the payee (the person or entity to whom the cheque is issued).
-- bank: The name of the bank (e.g., "State Bank of India").
-
-Now, extract the details from the following extracted text:
-{extracted_text}
-"""
-
-        response = model.generate_content(prompt)
-
-        if response and hasattr(response, "candidates") and response.candidates:
-            candidate = response.candidates[0]
-
-            if hasattr(candidate, "content") and hasattr(candidate.content, "parts") and candidate.content.parts:
-                refined_text = candidate.content.parts[0].text
-                refined_text = refined_text.replace("```json", "").replace("```", "").strip()
-                
-                try:
-                    cheque_data = json.loads(refined_text)
-                    return cheque_data
-                except json.JSONDecodeError as e:
-                    logging.error(f"Error parsing JSON: {e}")
-                    return None
-
-        logging.warning("Gemini returned an empty response.")
-        return None
-
-    except Exception as e:
-        logging.error(f"Error with Gemini API: {e}")
-        return None
+def refine_text_with_gemini(extracted_text, use_cache=True):
+    """Use Gemini API to refine extracted text, reusing cached results for identical text."""
+    return gemini_refiner.refine(extracted_text, use_cache)
 
 # MongoDB functions
+_mongo_client = None
+_mongo_lock = threading.Lock()
+_last_health_check = 0.0
+
+def get_mongo_client():
+    """Return the process-wide pooled MongoClient, creating it on first use."""
+    global _mongo_client
+    if _mongo_client is None:
+        with _mongo_lock:
+            if _mongo_client is None:
+                _mongo_client = MongoClient(MONGO_URI, maxPoolSize=MONGO_MAX_POOL_SIZE)
+    return _mongo_client
+
+def _reset_mongo_client():
+    """Drop the pooled client so the next call reconnects."""
+    global _mongo_client, _last_health_check
+    with _mongo_lock:
+        if _mongo_client is not None:
+            _mongo_client.close()
+        _mongo_client = None
+        _last_health_check = 0.0
+
 def get_db_connection():
-    """Establish a connection to MongoDB."""
+    """Return the pooled MongoDB database, pinging at most once per health-check interval."""
+    global _last_health_check
     try:
-        logging.info("Attempting to connect to MongoDB...")
-        client = MongoClient(MONGO_URI)
-        client.admin.command('ping')  # Test the connection
+        client = get_mongo_client()
+        if time.monotonic() - _last_health_check > MONGO_HEALTH_CHECK_INTERVAL:
+            logging.info("Checking MongoDB connection...")
+            client.admin.command('ping')  # Test the connection
+            _last_health_check = time.monotonic()
         db = client[DB_NAME]
-        logging.info("✅ Connected to MongoDB successfully!")
         return db, "✅ Connected to MongoDB successfully!"
     except ConnectionFailure as e:
+        _reset_mongo_client()
         logging.error(f"⚠️ MongoDB connection failed: {e}")
         return None, f"⚠️ MongoDB connection failed: {e}"
     except Exception as e:
+        _reset_mongo_client()
         logging.error(f"⚠️ Unexpected error during MongoDB connection: {e}")
         return None, f"⚠️ Unexpected error during MongoDB connection: {e}"
 
-def insert_cheque_details(db, cheque_data):
-    """Insert cheque details into the MongoDB collection."""
-    try:
-        write_concern = WriteConcern(w="majority")
-        collection = db[COLLECTION_NAME].with_options(write_concern=write_concern)
-        
-        logging.info("Attempting to insert cheque data into collection: %s", collection.full_name)
-        logging.info("Cheque data: %s", cheque_data)
-        
-        result = collection.insert_one(cheque_data)
-        
-        if result.inserted_id:
-            logging.info(f"Cheque details inserted with ID: {result.inserted_id}")
-            return result.inserted_id
-        else:
-            logging.error("Failed to insert cheque details.")
-            return None
-    except Exception as e:
-        logging.error(f"Error inserting cheque details: {e}")
-        return None
\ No newline at end of file
+def insert_cheque_details(store, cheque_data):
+    """Insert cheque details through a ChequeStore; returns the new id, or None for duplicates and failures."""
+    with span("db_insert"):
+        result = store.insert_many([cheque_data])
+    if result.inserted_ids:
+        logging.info(f"Cheque details inserted with ID: {result.inserted_ids[0]}")
+        return result.inserted_ids[0]
+    if result.duplicates:
+        increment("duplicate_cheques")
+        logging.info("Cheque is already stored, skipping insert.")
+    else:
+        increment("db_insert_failures")
+        logging.error("Failed to insert cheque details.")
+    return None
+
+class BulkChequeWriter:
+    def __init__(self, store, batch_size=100, flush_interval=5.0):
+        """
+        Buffer cheque documents and write them in batches
+        :param store: ChequeStore to write to (one bulk insert per batch)
+        :param batch_size: Flush once this many documents are buffered
+        :param flush_interval: Flush once the oldest buffered document is this many seconds old
+        """
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.inserted_ids = []
+        self.failed = 0
+        self.duplicates = 0
+        self._buffer = []
+        self._first_buffered = None
+
+    def add(self, cheque_data):
+        """Buffer a document, flushing when the batch is full or old enough."""
+        if not self._buffer:
+            self._first_buffered = time.monotonic()
+        self._buffer.append(cheque_data)
+        if len(self._buffer) >= self.batch_size or time.monotonic() - self._first_buffered >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered documents and return the IDs inserted by this flush."""
+        if not self._buffer:
+            return []
+        batch, self._buffer = self._buffer, []
+        with span("db_bulk_insert"):
+            result = self.store.insert_many(batch)
+        # Duplicate keys are cheques that are already stored, not failures
+        if result.duplicates:
+            self.duplicates += result.duplicates
+            increment("duplicate_cheques", result.duplicates)
+            logging.info(f"Skipped {result.duplicates} cheque(s) that are already stored")
+        if result.failed:
+            self.failed += result.failed
+            increment("db_insert_failures", result.failed)
+        self.inserted_ids.extend(result.inserted_ids)
+        logging.info(f"Bulk inserted {len(result.inserted_ids)} cheque(s)")
+        return result.inserted_ids
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
@@ -0,0 +1,72 @@
+# zone_ocr.py
+import os
+import json
+
+import numpy as np
+
+from metrics import span
+from ocr_engine import OCRRequest, get_ocr_engine
+
+DIGITS = "0123456789"
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+# Field zones on the normalized (800x400) cheque, as (left, top, right, bottom) fractions of width/height.
+# psm is the Tesseract page-segmentation mode; whitelist restricts the recognized characters.
+FIELD_ZONES = {
+    "bank": {"box": (0.00, 0.00, 0.60, 0.18), "psm": 7, "whitelist": None},
+    "date": {"box": (0.70, 0.03, 0.99, 0.16), "psm": 7, "whitelist": DIGITS + "/-."},
+    "payee": {"box": (0.04, 0.16, 0.85, 0.30), "psm": 7, "whitelist": None},
+    "amount_words": {"box": (0.04, 0.28, 0.72, 0.48), "psm": 6, "whitelist": LETTERS + " -/"},
+    "amount": {"box": (0.72, 0.30, 0.99, 0.46), "psm": 7, "whitelist": DIGITS + ",./-"},
+    "account": {"box": (0.04, 0.48, 0.60, 0.62), "psm": 7, "whitelist": None},
+    "micr": {"box": (0.10, 0.84, 0.90, 1.00), "psm": 7, "whitelist": DIGITS + " "},
+}
+
+# Labels used when the zone results are handed to Gemini as text
+ZONE_LABELS = {
+    "bank": "Bank",
+    "date": "Date",
+    "payee": "Pay",
+    "amount_words": "Rupees",
+    "amount": "Amount Rs.",
+    "account": "A/c No",
+    "micr": "MICR",
+}
+
+def load_zones(path=None):
+    """Return FIELD_ZONES, overridden by a JSON file of the same shape if CHEQUE_ZONES_PATH (or path) is set."""
+    path = path or os.getenv("CHEQUE_ZONES_PATH")
+    zones = dict(FIELD_ZONES)
+    if path:
+        with open(path) as f:
+            for field, zone in json.load(f).items():
+                zones[field] = {**FIELD_ZONES.get(field, {"psm": 7, "whitelist": None}), **zone}
+    return zones
+
+
+def crop_zone(image, box):
+    """Crop a normalized (left, top, right, bottom) box out of an image array."""
+    height, width = image.shape[:2]
+    left, top, right, bottom = box
+    return image[int(top * height):int(bottom * height), int(left * width):int(right * width)]
+
+
+def ocr_zones(image, zones=None, engine=None):
+    """OCR every field zone of a normalized cheque in parallel and return {field: text}."""
+    zones = zones or load_zones()
+    engine = engine or get_ocr_engine()
+    image = np.asarray(image)
+    fields = [field for field, zone in zones.items() if crop_zone(image, zone["box"]).size]
+    requests = [OCRRequest(crop_zone(image, zones[field]["box"]), zones[field]["psm"], zones[field].get("whitelist"))
+                for field in fields]
+    with span("zone_ocr"):
+        results = engine.recognize_many(requests)
+    zone_text = {field: "" for field in zones}
+    zone_text.update({field: result.text.strip() for field, result in zip(fields, results)})
+    return zone_text
+
+
+def format_zone_text(zone_text):
+    """Render zone results as labelled lines, skipping empty zones."""
+    lines = [f"{ZONE_LABELS.get(field, field)}: {' '.join(text.split())}" for field, text in zone_text.items() if text]
+    return "\n".join(lines)